@@ -37,7 +37,10 @@ setup(
     ],
     install_requires=[
         "Django==2.0.4",
-        "requests==2.18.4",
+        "requests==2.32.3",
     ],
+    extras_require={
+        'orjson': ['orjson'],
+    },
     include_package_data=True,
 )
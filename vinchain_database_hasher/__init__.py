@@ -0,0 +1 @@
+default_app_config = 'vinchain_database_hasher.apps.VinchainDatabaseHasherConfig'
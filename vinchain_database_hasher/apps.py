@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class VinchainDatabaseHasherConfig(AppConfig):
     name = 'vinchain_database_hasher'
+
+    def ready(self):
+        from vinchain_database_hasher.logs import configure_logging
+
+        configure_logging()
@@ -0,0 +1,213 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from signal import signal, SIG_IGN, SIGINT, SIGTERM
+import multiprocessing
+
+from django.db import connections
+
+from vinchain_database_hasher.checkpoint import get_checkpoint_store
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.tasks import hash_range, standard_checkpoint
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def split_range(start_id, end_id, shards):
+    """
+    Split the ids after start_id up to end_id into at most shards (after_id, last_id) ranges of about the same size.
+    """
+    size = max(1, -(-(end_id - start_id) // max(1, shards)))
+
+    return [(after_id, min(after_id + size, end_id)) for after_id in range(start_id, end_id, size)]
+
+
+def shard_key(data_source, after_id, last_id):
+    return '{}:backfill:{}-{}'.format(data_source, after_id, last_id)
+
+
+def shard_keys(source, after_id, last_id):
+    """
+    The progress keys of a shard, one per standard of source.
+    """
+    key = shard_key(source.data_source, after_id, last_id)
+    standard_versions = source.get_standards()
+
+    return [standard_checkpoint(key, standard_version, standard_versions) for standard_version in standard_versions]
+
+
+def shard_finished(store, source, after_id, last_id):
+    return all((store.get(key) or after_id) >= last_id for key in shard_keys(source, after_id, last_id))
+
+
+def plan_key(data_source):
+    return '{}:backfill'.format(data_source)
+
+
+def get_plan(data_source):
+    """
+    The (start_id, end_id, shards) of the unfinished backfill of data_source, or None.
+    """
+    plan = get_checkpoint_store().get(plan_key(data_source))
+
+    return tuple(int(value) for value in plan.split(',')) if plan else None
+
+
+def save_plan(data_source, start_id, end_id, shards):
+    get_checkpoint_store().set(plan_key(data_source), '{},{},{}'.format(start_id, end_id, shards))
+
+
+def clear_plan(source, start_id, end_id, shards):
+    """
+    Remove a saved plan of source and the progress of its shards for every standard.
+    """
+    store = get_checkpoint_store()
+
+    for after_id, last_id in split_range(start_id, end_id, shards):
+        for key in shard_keys(source, after_id, last_id):
+            store.remove(key)
+
+    store.remove(plan_key(source.data_source))
+
+
+class _EventFlag(object):
+    """
+    A multiprocessing event behind the stop_flag[0] interface of the hashing loop.
+    """
+
+    def __init__(self, event):
+        self.event = event
+
+    def __getitem__(self, index):
+        return self.event.is_set()
+
+
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+    # the parent process stops the workers through the event
+    signal(SIGINT, SIG_IGN)
+    signal(SIGTERM, SIG_IGN)
+
+
+def backfill_shard(source, after_id, last_id):
+    """
+    Hash one shard in a worker process, every standard resuming after the progress saved for it.
+    Returns the number of submitted records.
+    """
+    key = shard_key(source.data_source, after_id, last_id)
+    store = get_checkpoint_store()
+
+    if shard_finished(store, source, after_id, last_id):
+        return 0
+
+    latest_hashed = store.get(key)
+
+    if latest_hashed is None:
+        latest_hashed = after_id
+
+    stop_flag = _EventFlag(_stop_event) if _stop_event is not None else [False]
+
+    try:
+        hashed = hash_range(source, stop_flag, latest_hashed, last_id, checkpoint=key, first_id=after_id)
+    finally:
+        connections.close_all()
+
+    if not stop_flag[0]:
+        # rows at the end of the shard can be filtered out, the shard is complete anyway
+        for standard_key in shard_keys(source, after_id, last_id):
+            store.set(standard_key, last_id)
+
+    return hashed
+
+
+class Backfill(object):
+    """
+    Hash the ids of source after start_id up to end_id in shards, processed in parallel by a process pool.
+    Every shard saves its own progress in the checkpoint store, so an interrupted backfill resumes with the same
+    arguments. Once all shards are complete the checkpoints of the data source that reached start_id are moved
+    to end_id, and the shard progress and the saved plan are removed.
+    """
+
+    def __init__(self, source, start_id, end_id, shards, processes):
+        # every worker hashes in its own process already
+        self.source = source.copy(hash_workers=0)
+        self.start_id = start_id
+        self.end_id = end_id
+        self.shard_count = shards
+        self.shards = split_range(start_id, end_id, shards)
+        self.processes = processes
+        self.stop_event = multiprocessing.Event()
+        self.finished = False
+
+    def stop(self):
+        self.stop_event.set()
+
+    def pending_shards(self):
+        store = get_checkpoint_store()
+
+        return [
+            (after_id, last_id) for after_id, last_id in self.shards
+            if not shard_finished(store, self.source, after_id, last_id)
+        ]
+
+    def move_checkpoints(self):
+        """
+        Move the checkpoint of every standard that reached start_id to end_id.
+        A checkpoint before start_id, or a missing one, stays: the ids in between have not been hashed.
+        """
+        store = get_checkpoint_store()
+        standard_versions = self.source.get_standards()
+
+        for standard_version in standard_versions:
+            key = standard_checkpoint(self.source.data_source, standard_version, standard_versions)
+            checkpoint = store.get(key)
+
+            if checkpoint is not None and self.start_id <= checkpoint < self.end_id:
+                store.set(key, self.end_id)
+            elif checkpoint is None or checkpoint < self.start_id:
+                _logger.warning('%s: Checkpoint %s at %s is before the backfill of ids %s-%s, it is not moved',
+                                settings.app_name, key, checkpoint, self.start_id, self.end_id,
+                                extra={'data_source': self.source.data_source})
+
+    def run(self, callback=None):
+        """
+        Returns the number of submitted records, callback is called with (after_id, last_id, hashed) per shard.
+        """
+        # forked workers must not share the connections of this process
+        connections.close_all()
+
+        hashed = 0
+
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                 initargs=(self.stop_event,)) as executor:
+            futures = {
+                executor.submit(backfill_shard, self.source, after_id, last_id): (after_id, last_id)
+                for after_id, last_id in self.pending_shards()
+            }
+
+            for future in as_completed(futures):
+                after_id, last_id = futures[future]
+
+                try:
+                    shard_hashed = future.result()
+                except Exception:
+                    # let the other shards save their progress and stop
+                    self.stop()
+                    raise
+
+                hashed += shard_hashed
+
+                if callback is not None:
+                    callback(after_id, last_id, shard_hashed)
+
+        if not self.stop_event.is_set() and not self.pending_shards():
+            self.move_checkpoints()
+            clear_plan(self.source, self.start_id, self.end_id, self.shard_count)
+            self.finished = True
+
+        return hashed
@@ -0,0 +1,67 @@
+from itertools import chain, islice
+from threading import Lock
+
+from vinchain_database_hasher.conf import settings
+
+
+class AdaptiveBatchSize(object):
+    """
+    AIMD controller for the number of rows per VinDB submission.
+    The size grows by a fixed step while submissions are acknowledged within target_latency,
+    is halved when they are slow or fail, and is scaled down when the payload exceeds max_payload_bytes.
+    """
+
+    def __init__(self, min_size, max_size, target_latency, max_payload_bytes=0, decrease=0.5):
+        self.min_size = max(1, min(min_size or max_size, max_size))
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self.decrease = decrease
+        self.step = max(1, (self.max_size - self.min_size) // 10)
+        self.size = self.max_size
+        self._lock = Lock()
+
+    def __call__(self):
+        return self.size
+
+    def update(self, latency, status_code, payload_bytes):
+        with self._lock:
+            size = self.size
+
+            if status_code != 201 or latency > self.target_latency:
+                size = int(size * self.decrease)
+            elif self.max_payload_bytes and payload_bytes > self.max_payload_bytes:
+                size = int(size * self.max_payload_bytes / payload_bytes)
+            else:
+                size += self.step
+
+            self.size = max(self.min_size, min(self.max_size, size))
+
+        return self.size
+
+
+_controllers = {}
+
+
+def get_batch_size(data_source):
+    controller = _controllers.get(data_source)
+
+    if controller is None:
+        controller = _controllers[data_source] = AdaptiveBatchSize(
+            settings.min_size_hashed_batch,
+            settings.max_size_hashed_batch,
+            settings.batch_target_latency,
+            max_payload_bytes=settings.batch_max_payload_bytes,
+        )
+
+    return controller
+
+
+def iter_batches(rows, batch_size):
+    """
+    Split rows into lazy batches, batch_size is called before every batch.
+    """
+    rows = iter(rows)
+
+    for row in rows:
+        yield chain([row], islice(rows, max(batch_size() - 1, 0)))
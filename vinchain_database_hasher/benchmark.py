@@ -0,0 +1,254 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from threading import Lock
+import os
+import resource
+import string
+import tempfile
+import time
+
+from django.db import connection, connections, models
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.metrics import timings
+from vinchain_database_hasher.tasks import hash_source
+
+VIN_CHARACTERS = 'ABCDEFGHJKLMNPRSTUVWXYZ0123456789'
+JUNK_VINS = ('', 'NOT A VIN!', 'X' * 25)
+
+
+class NullSigner(object):
+    """
+    Signer stand-in for runs without a VinChain node.
+    """
+
+    last_duration = 0.0
+
+    def sign(self, subject):
+        return ''
+
+
+class QueryCounter(object):
+    """
+    Count SQL queries on every database connection, including the ones opened by pipeline threads.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+
+        return execute(sql, params, many, context)
+
+    def _connection_created(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        for conn in connections.all():
+            self._connection_created(None, conn)
+
+        connection_created.connect(self._connection_created)
+
+    def uninstall(self):
+        connection_created.disconnect(self._connection_created)
+
+        for conn in connections.all():
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+@contextmanager
+def override_settings(**values):
+    missing = object()
+    previous = {name: settings.__dict__.get(name, missing) for name in values}
+
+    for name, value in values.items():
+        setattr(settings, name, value)
+
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is missing:
+                delattr(settings, name)
+            else:
+                setattr(settings, name, value)
+
+
+@contextmanager
+def throwaway_database(*table_models):
+    """
+    Create a throwaway test database, with tables for unmanaged models too.
+    """
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+    try:
+        existing = connection.introspection.table_names()
+
+        with connection.schema_editor() as editor:
+            for model in table_models:
+                if model._meta.db_table not in existing:
+                    editor.create_model(model)
+
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def fake_vin(rnd, junk_rate=0.0):
+    if junk_rate and rnd.random() < junk_rate:
+        return rnd.choice(JUNK_VINS)
+
+    return ''.join(rnd.choice(VIN_CHARACTERS) for _ in range(17))
+
+
+def fake_value(field, rnd):
+    if isinstance(field, models.DateTimeField):
+        return timezone.now() - timedelta(days=rnd.randint(4, 400), seconds=rnd.randint(0, 86400))
+
+    if isinstance(field, models.DateField):
+        return date.today() - timedelta(days=rnd.randint(4, 400))
+
+    if isinstance(field, (models.BooleanField, models.NullBooleanField)):
+        return rnd.random() < 0.5
+
+    if isinstance(field, models.DecimalField):
+        digits = min(field.max_digits - field.decimal_places, 6) + field.decimal_places
+        return Decimal(rnd.randint(0, 10 ** digits - 1)).scaleb(-field.decimal_places)
+
+    if isinstance(field, models.SmallIntegerField):
+        return rnd.randint(0, 100)
+
+    if isinstance(field, models.IntegerField):
+        return rnd.randint(0, 100000)
+
+    if isinstance(field, models.FloatField):
+        return rnd.random() * 100000
+
+    if isinstance(field, (models.CharField, models.TextField)):
+        length = min(field.max_length or 200, 200)
+        return ''.join(rnd.choice(string.ascii_letters + ' ') for _ in range(rnd.randint(1, length)))
+
+    if field.null:
+        return None
+
+    return field.get_default()
+
+
+def fake_instance(model, rnd, **values):
+    instance = model()
+
+    for field in model._meta.concrete_fields:
+        if field.attname in values:
+            setattr(instance, field.attname, values[field.attname])
+        elif field.primary_key and isinstance(field, models.AutoField):
+            continue
+        elif field.is_relation:
+            setattr(instance, field.attname, None)
+        else:
+            setattr(instance, field.attname, fake_value(field, rnd))
+
+    return instance
+
+
+def generate_cars(model, count, rnd, junk_rate=0.0, vin_key='vin', batch_size=1000):
+    for start in range(0, count, batch_size):
+        model.objects.bulk_create([
+            fake_instance(model, rnd, **{vin_key: fake_vin(rnd, junk_rate)})
+            for _ in range(min(batch_size, count - start))
+        ])
+
+    return list(model.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def generate_children(model, car_ids, per_car, rnd, batch_size=1000):
+    instances = []
+
+    for car_id in car_ids:
+        for _ in range(per_car):
+            instances.append(fake_instance(model, rnd, car_id=car_id))
+
+            if len(instances) >= batch_size:
+                model.objects.bulk_create(instances)
+                instances = []
+
+    if instances:
+        model.objects.bulk_create(instances)
+
+
+def _status_kb(name):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(name + ':'):
+                return int(line.split()[1]) * 1024
+
+    return None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of the process to its current size, returns the current size in bytes.
+    Returns None where the kernel cannot reset it, the peak then covers the whole process lifetime.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+
+        return _status_kb('VmRSS')
+    except OSError:
+        return None
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process in bytes, since the last reset_peak_rss.
+    """
+    try:
+        return _status_kb('VmHWM')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_benchmark(source, batch_size, host, query_counter):
+    """
+    Run one full hashing pass of source against host and return rows, elapsed seconds, stage timings, query count,
+    and the resident set size at the start of the pass and its peak during the pass.
+    """
+    fd, checkpoint_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+
+    source = source.copy(data_source='benchmark-{}-{}'.format(batch_size, int(time.time() * 1000)))
+
+    try:
+        with override_settings(vindb_host=host, checkpoint_path=checkpoint_path, max_size_hashed_batch=batch_size):
+            timings.reset()
+            query_counter.reset()
+            start_rss = reset_peak_rss()
+            start_time = time.time()
+            rows = hash_source(source, [False])
+            elapsed = time.time() - start_time
+            run_peak_rss = peak_rss()
+    finally:
+        os.unlink(checkpoint_path)
+
+    return {
+        'batch_size': batch_size,
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed else 0.0,
+        'queries': query_counter.count,
+        'start_rss': start_rss,
+        'peak_rss': run_peak_rss,
+        'stages': timings.snapshot(),
+    }
@@ -0,0 +1,56 @@
+from contextlib import closing
+import sqlite3
+import time
+
+from vinchain_database_hasher.conf import settings
+
+
+class CheckpointStore(object):
+    """
+    Last acknowledged uuid per data source, kept in a local SQLite file.
+    Every call uses its own connection, so the store can be shared between threads and processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints ('
+                'data_source TEXT PRIMARY KEY, uuid NOT NULL, updated_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, data_source):
+        with closing(self._connect()) as db:
+            row = db.execute('SELECT uuid FROM checkpoints WHERE data_source = ?', (data_source,)).fetchone()
+
+        return row[0] if row else None
+
+    def set(self, data_source, uuid):
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'INSERT OR REPLACE INTO checkpoints (data_source, uuid, updated_at) VALUES (?, ?, ?)',
+                (data_source, uuid, time.time())
+            )
+
+    def remove(self, data_source):
+        with closing(self._connect()) as db, db:
+            db.execute('DELETE FROM checkpoints WHERE data_source = ?', (data_source,))
+
+
+_stores = {}
+
+
+def get_checkpoint_store():
+    if not settings.checkpoint_path:
+        return None
+
+    store = _stores.get(settings.checkpoint_path)
+
+    if store is None:
+        store = _stores[settings.checkpoint_path] = CheckpointStore(settings.checkpoint_path)
+
+    return store
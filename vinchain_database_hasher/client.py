@@ -0,0 +1,116 @@
+import gzip
+import os
+import zlib
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from vinchain_database_hasher.conf import settings
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+class VinDBClient(object):
+    """
+    VinDB HTTP client with a pooled keep-alive session.
+    Idempotent requests are retried on connection errors and 502/503/504 responses,
+    record creation is retried on connection errors only.
+    """
+
+    def __init__(self, host, pool_size=4, retries=3, backoff_factor=0.5, connect_timeout=10, timeout=120,
+                 compress=False):
+        self.host = host
+        self.timeout = (connect_timeout, timeout)
+        self.compress = compress
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False,
+            )
+        )
+
+        self.session = Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        return '{}{}'.format(self.host, path)
+
+    def get_last_sent_id(self, data_source):
+        row = self.session.get(
+            self.url('/vindb/vin_records/last/'),
+            params={
+                'data_source': data_source,
+            },
+            timeout=self.timeout
+        ).json()
+
+        return row.get('uuid', 0)
+
+    def create_records(self, body, content_type=None):
+        """
+        POST the encoded records. body is bytes, or an iterable of bytes sent with chunked transfer encoding.
+        Chunked bodies keep the timeout and the retries only since requests 2.32, which sends them through urllib3.
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        headers = {}
+
+        if content_type:
+            headers['Content-Type'] = content_type
+
+        if self.compress:
+            body = gzip.compress(body) if isinstance(body, bytes) else _gzip_chunks(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        return self.session.post(
+            self.url('/vindb/vin_records/create/'),
+            data=body,
+            headers=headers,
+            timeout=self.timeout
+        )
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+
+
+def get_client():
+    key = (
+        os.getpid(), settings.vindb_host, settings.vindb_pool_size, settings.vindb_retries,
+        settings.vindb_connect_timeout, settings.vindb_timeout, settings.vindb_gzip,
+    )
+    client = _clients.get(key)
+
+    if client is None:
+        _clients.clear()
+        client = _clients[key] = VinDBClient(
+            settings.vindb_host,
+            pool_size=settings.vindb_pool_size,
+            retries=settings.vindb_retries,
+            connect_timeout=settings.vindb_connect_timeout,
+            timeout=settings.vindb_timeout,
+            compress=settings.vindb_gzip,
+        )
+
+    return client
@@ -6,9 +6,11 @@ from django.test.signals import setting_changed
 
 DEFAULTS = {
     'app_name': 'vinchain_database_hasher',
+    'sources': [],
     'vehicle_model': ('path', 'model'),
     'vehicle_model_primary_key': 'id',
     'vehicle_model_vin_key': 'vin',
+    'vin_filter_in_db': False,
     'vehicle_serializer': ('vinchain_database_hasher.tasks', 'dummy_serializer'),
     'vinchain_node': '',
     'vinchain_wallet_password': '',
@@ -18,10 +20,41 @@ DEFAULTS = {
     'vindb_hasher': '',
     'vindb_host': '',
     'vindb_use_hasher': False,
+    'vindb_pool_size': 4,
+    'vindb_retries': 3,
+    'vindb_connect_timeout': 10,
+    'vindb_timeout': 120,
+    'vindb_gzip': False,
+    'vindb_stream': '',
+    'vindb_stream_chunk_records': 500,
     'max_size_hashed_batch': 0,
+    'min_size_hashed_batch': 0,
+    'batch_target_latency': 30,
+    'batch_max_payload_bytes': 0,
+    'db_chunk_size': 1000,
+    'hash_workers': 0,
+    'webapp_hash_workers': 0,
+    'pipeline_queue_size': 1,
+    'checkpoint_path': '',
+    'payload_dump_rate': 0,
+    'payload_dump_max_bytes': 4096,
+    'metrics_host': '127.0.0.1',
+    'metrics_port': 0,
+    'wakeup_min_delay': 1,
+    'wakeup_max_delay': 60,
+    'hash_cache_path': '',
+    'hash_cache_max_entries': 1000000,
+    'delivery_retries': 5,
+    'delivery_backoff': 1,
+    'delivery_max_backoff': 60,
+    'dead_letter_path': '',
+    'latest_id_refresh_interval': 10,
+    'submit_concurrency': 1,
     'logstash_host': 'localhost',
     'logstash_port': 5100,
     'logging_version': 1,
+    'log_queue_size': 10000,
+    'log_max_extra_items': 20,
 }
 
 
@@ -0,0 +1,226 @@
+from contextlib import closing
+from json import (
+    dumps as json_dumps,
+    loads as json_loads,
+)
+from random import random
+import sqlite3
+import time
+
+from requests import ReadTimeout, RequestException
+
+from vinchain_database_hasher.conf import settings
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# client errors that say nothing about the records: authentication, request timeout and throttling
+TRANSIENT_CLIENT_ERRORS = (401, 403, 408, 429)
+
+
+class SubmitError(Exception):
+    """
+    VinDB answered a create request with a status other than 201.
+    """
+
+    def __init__(self, message, status_code=None):
+        super(SubmitError, self).__init__(message)
+        self.status_code = status_code
+
+
+def backoff_delay(attempt, base=1, cap=60):
+    """
+    Full jitter exponential backoff: a random delay up to base * 2 ** attempt, capped at cap seconds.
+    """
+    return random() * min(cap, base * 2 ** attempt)
+
+
+def stoppable_sleep(seconds, stop_flag, tick=1):
+    """
+    Sleep up to seconds, waking every tick seconds to return early once stop_flag[0] is set.
+    """
+    deadline = time.time() + seconds
+
+    while not stop_flag[0] and time.time() < deadline:
+        time.sleep(min(tick, max(deadline - time.time(), 0)))
+
+
+def _splits(error):
+    # too large for VinDB: rejected as such, or sent but not answered in time
+    if isinstance(error, SubmitError):
+        return error.status_code == 413
+
+    return isinstance(error, ReadTimeout)
+
+
+def _refused(error):
+    # VinDB answered and rejected the records, connection errors and 5xx are outages
+    return (
+        isinstance(error, SubmitError) and error.status_code is not None
+        and 400 <= error.status_code < 500 and error.status_code not in TRANSIENT_CLIENT_ERRORS
+    )
+
+
+class Delivery(object):
+    """
+    Submit records until VinDB has acknowledged all of them.
+    Failed requests are retried with jittered exponential backoff, only the unacknowledged records are resubmitted,
+    and batches rejected as too large or timing out are split in halves. Records VinDB still refuses after retries,
+    with a 4xx status or by leaving them unacknowledged, are moved to the dead letter store, or only logged
+    without a store. Any other error, like a connection error or a 5xx status, is raised after retries.
+    """
+
+    def __init__(self, submit, stop_flag, retries=5, backoff=1, max_backoff=60, dead_letters=None):
+        self.submit = submit
+        self.stop_flag = stop_flag
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.dead_letters = dead_letters
+
+    def deliver(self, data_source, records):
+        """
+        Returns the number of acknowledged and the number of dead lettered records.
+        """
+        pending = list(records)
+        acknowledged = 0
+        attempt = 0
+
+        while pending:
+            try:
+                acked = {str(record['uuid']) for record in self.submit(pending)}
+            except (SubmitError, RequestException) as e:
+                if _splits(e) and len(pending) > 1:
+                    middle = len(pending) // 2
+                    first = self.deliver(data_source, pending[:middle])
+                    second = self.deliver(data_source, pending[middle:])
+
+                    return acknowledged + first[0] + second[0], first[1] + second[1]
+
+                error = e
+                refused = _refused(e)
+            else:
+                acknowledged += len(acked)
+                pending = [record for record in pending if str(record['uuid']) not in acked]
+
+                if not pending:
+                    break
+
+                if acked:
+                    # progress, so the missing records get a fresh set of retries
+                    attempt = 0
+
+                error = SubmitError('{} of {} records have not been acknowledged'.format(
+                    len(pending), len(pending) + len(acked))
+                )
+                refused = True
+
+            if attempt >= self.retries or self.stop_flag[0]:
+                if not refused or self.stop_flag[0]:
+                    raise error
+
+                if self.dead_letters is None:
+                    _logger.error('%s: %d records refused by VinDB are skipped (ids %s-%s). Error: "%s"',
+                                  settings.app_name, len(pending), pending[0]['uuid'], pending[-1]['uuid'], error,
+                                  extra={'data_source': data_source,
+                                         'refused_rows_ids': [record['uuid'] for record in pending]})
+
+                    return acknowledged, 0
+
+                self.dead_letters.add(data_source, pending, str(error))
+
+                return acknowledged, len(pending)
+
+            stoppable_sleep(backoff_delay(attempt, self.backoff, self.max_backoff), self.stop_flag)
+            attempt += 1
+
+        return acknowledged, 0
+
+
+class DeadLetterStore(object):
+    """
+    Hash records VinDB refused, kept in a local SQLite file until the resubmit_dead_letters command submits them again.
+    Records are keyed by data source, standard version and uuid, so every standard keeps its own failed record.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS dead_letters ('
+                'data_source TEXT NOT NULL, standard_version TEXT NOT NULL, uuid TEXT NOT NULL, record TEXT NOT NULL, '
+                'reason TEXT, failed_at REAL NOT NULL, PRIMARY KEY (data_source, standard_version, uuid))'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, data_source, records, reason=''):
+        now = time.time()
+
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                'INSERT OR REPLACE INTO dead_letters (data_source, standard_version, uuid, record, reason, failed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (data_source, str(record['standard_version']), str(record['uuid']), json_dumps(record), reason, now)
+                    for record in records
+                ]
+            )
+
+    def get(self, data_source, limit=None, failed_before=None):
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                'SELECT record FROM dead_letters WHERE data_source = ? AND failed_at < ? ORDER BY failed_at LIMIT ?',
+                (data_source, float('inf') if failed_before is None else failed_before, -1 if limit is None else limit)
+            ).fetchall()
+
+        return [json_loads(record) for record, in rows]
+
+    def remove(self, data_source, records, failed_before=None):
+        """
+        Remove records by standard and uuid, with failed_before only the ones that have not failed again since.
+        """
+        failed_before = float('inf') if failed_before is None else failed_before
+
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                'DELETE FROM dead_letters '
+                'WHERE data_source = ? AND standard_version = ? AND uuid = ? AND failed_at < ?',
+                [
+                    (data_source, str(record['standard_version']), str(record['uuid']), failed_before)
+                    for record in records
+                ]
+            )
+
+    def count(self, data_source):
+        with closing(self._connect()) as db:
+            return db.execute('SELECT COUNT(*) FROM dead_letters WHERE data_source = ?', (data_source,)).fetchone()[0]
+
+
+_stores = {}
+
+
+def get_dead_letter_store():
+    if not settings.dead_letter_path:
+        return None
+
+    store = _stores.get(settings.dead_letter_path)
+
+    if store is None:
+        store = _stores[settings.dead_letter_path] = DeadLetterStore(settings.dead_letter_path)
+
+    return store
+
+
+def get_delivery(submit, stop_flag):
+    return Delivery(
+        submit,
+        stop_flag,
+        retries=settings.delivery_retries,
+        backoff=settings.delivery_backoff,
+        max_backoff=settings.delivery_max_backoff,
+        dead_letters=get_dead_letter_store(),
+    )
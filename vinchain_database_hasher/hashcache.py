@@ -0,0 +1,117 @@
+from contextlib import closing
+from hashlib import sha1
+from json import dumps as json_dumps
+import sqlite3
+import time
+
+from vinchain_database_hasher.conf import settings
+
+
+def row_fingerprint(row):
+    """
+    Digest of the row content, enrichment included, that changes whenever the serialized row could change.
+    """
+    return sha1(json_dumps(row, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class HashCache(object):
+    """
+    Computed hashes by (uuid, standard_version, row fingerprint), kept in a local SQLite file.
+    Lookups refresh the entries they hit, and the least recently used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path, max_entries=0):
+        self.path = path
+        self.max_entries = max_entries
+
+        with closing(self._connect()) as db, db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                'uuid TEXT NOT NULL, standard_version INTEGER NOT NULL, fingerprint TEXT NOT NULL, '
+                'hash TEXT NOT NULL, used_at REAL NOT NULL, PRIMARY KEY (uuid, standard_version))'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS hashes_used_at ON hashes (used_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, standard_version, fingerprints):
+        """
+        Cached hashes of the {uuid: fingerprint} items whose fingerprint still matches, as {uuid: hash}.
+        """
+        keys = {str(uuid): uuid for uuid in fingerprints}
+        hashes = {}
+
+        if not keys:
+            return hashes
+
+        uuids = list(keys)
+
+        with closing(self._connect()) as db, db:
+            # stay below the SQLite host parameter limit
+            for start in range(0, len(uuids), 500):
+                chunk = uuids[start:start + 500]
+                rows = db.execute(
+                    'SELECT uuid, fingerprint, hash FROM hashes WHERE standard_version = ? AND uuid IN ({})'.format(
+                        ','.join('?' * len(chunk))
+                    ),
+                    [standard_version] + chunk
+                )
+
+                for uuid, fingerprint, row_hash in rows:
+                    if fingerprints[keys[uuid]] == fingerprint:
+                        hashes[keys[uuid]] = row_hash
+
+            if hashes:
+                now = time.time()
+                db.executemany(
+                    'UPDATE hashes SET used_at = ? WHERE uuid = ? AND standard_version = ?',
+                    [(now, str(uuid), standard_version) for uuid in hashes]
+                )
+
+        return hashes
+
+    def set_many(self, standard_version, entries):
+        """
+        Store (uuid, fingerprint, hash) entries, replacing the previous hash of changed rows.
+        """
+        if not entries:
+            return
+
+        now = time.time()
+
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                'INSERT OR REPLACE INTO hashes (uuid, standard_version, fingerprint, hash, used_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(str(uuid), standard_version, fingerprint, row_hash, now) for uuid, fingerprint, row_hash in entries]
+            )
+
+            if self.max_entries:
+                self._evict(db)
+
+    def _evict(self, db):
+        excess = db.execute('SELECT COUNT(*) FROM hashes').fetchone()[0] - self.max_entries
+
+        if excess > 0:
+            db.execute(
+                'DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY used_at LIMIT ?)', (excess,)
+            )
+
+
+_caches = {}
+
+
+def get_hash_cache():
+    if not settings.hash_cache_path:
+        return None
+
+    cache = _caches.get(settings.hash_cache_path)
+
+    if cache is None:
+        cache = _caches[settings.hash_cache_path] = HashCache(
+            settings.hash_cache_path, settings.hash_cache_max_entries
+        )
+
+    return cache
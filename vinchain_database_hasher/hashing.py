@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import time
+
+from vinchain_hashing import hash_functions
+
+from vinchain_database_hasher.hashcache import row_fingerprint
+from vinchain_database_hasher.metrics import hash_cache_hits, timings
+
+
+_executors = {}
+
+
+def get_hash_executor(workers):
+    executor = _executors.get(workers)
+
+    if executor is None:
+        executor = _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+
+    return executor
+
+
+def hash_row(serializer, standard_versions, row):
+    serialized = serializer(row)
+
+    return [hash_functions[standard_version](serialized) for standard_version in standard_versions]
+
+
+def iter_hashed_rows(rows, serializer, standard_versions):
+    """
+    Yield every row with its hashes under standard_versions, the row is serialized once for all of them.
+    """
+    functions = [hash_functions[standard_version] for standard_version in standard_versions]
+    serialize_time = hash_time = 0.0
+    hashed = 0
+
+    try:
+        for row in rows:
+            start_time = time.perf_counter()
+            serialized = serializer(row)
+            serialized_time = time.perf_counter()
+            row_hashes = [hash_function(serialized) for hash_function in functions]
+            serialize_time += serialized_time - start_time
+            hash_time += time.perf_counter() - serialized_time
+            hashed += 1
+
+            yield row, row_hashes
+    finally:
+        timings.add('serialize', serialize_time, hashed)
+        timings.add('hash', hash_time, hashed)
+
+
+def _hash_rows(rows, serializer, standard_versions, workers=0):
+    if workers > 1:
+        rows = list(rows)
+
+        with timings.time('hash'):
+            hashes = list(get_hash_executor(workers).map(
+                partial(hash_row, serializer, standard_versions), rows,
+                chunksize=max(1, len(rows) // (workers * 4))
+            ))
+
+        return zip(rows, hashes)
+
+    return iter_hashed_rows(rows, serializer, standard_versions)
+
+
+def hash_records_by_standard(rows, serializer, standard_versions, primary_key='id', vin_key='vin', workers=0,
+                             cache=None, after_ids=None):
+    """
+    Build VinDB hash records for rows under every standard version as {standard_version: records},
+    keeping the rows order. Every row is serialized once, whatever the number of standards.
+    With after_ids a standard only gets the rows after its id in {standard_version: id}.
+    With workers > 1 the serializer and hash functions run in a process pool,
+    so serializer has to be importable by the worker processes.
+    With a HashCache, rows whose content did not change since they were last hashed are not serialized again.
+    """
+    rows = list(rows)
+    after_ids = after_ids or {}
+    wanted = {
+        standard_version: [
+            row for row in rows
+            if after_ids.get(standard_version) is None or row[primary_key] > after_ids[standard_version]
+        ]
+        for standard_version in standard_versions
+    }
+    wanted_ids = {standard_version: set(row[primary_key] for row in wanted[standard_version])
+                  for standard_version in standard_versions}
+    hashes = {standard_version: {} for standard_version in standard_versions}
+    fingerprints = {}
+
+    if cache is not None:
+        with timings.time('cache'):
+            fingerprints = {row[primary_key]: row_fingerprint(row) for row in rows}
+
+            for standard_version in standard_versions:
+                hashes[standard_version] = cache.get_many(standard_version, {
+                    row[primary_key]: fingerprints[row[primary_key]] for row in wanted[standard_version]
+                })
+                hash_cache_hits.inc(len(hashes[standard_version]), standard_version=standard_version)
+
+    # rows grouped by the standards they still need a hash for, usually a single group
+    groups = OrderedDict()
+
+    for row in rows:
+        uuid = row[primary_key]
+        needed = tuple(
+            standard_version for standard_version in standard_versions
+            if uuid in wanted_ids[standard_version] and uuid not in hashes[standard_version]
+        )
+
+        if needed:
+            groups.setdefault(needed, []).append(row)
+
+    computed = {standard_version: [] for standard_version in standard_versions}
+
+    for needed, group in groups.items():
+        for row, row_hashes in _hash_rows(group, serializer, needed, workers):
+            for standard_version, row_hash in zip(needed, row_hashes):
+                hashes[standard_version][row[primary_key]] = row_hash
+                computed[standard_version].append((row[primary_key], fingerprints.get(row[primary_key]), row_hash))
+
+    if cache is not None:
+        with timings.time('cache'):
+            for standard_version in standard_versions:
+                cache.set_many(standard_version, computed[standard_version])
+
+    return {
+        standard_version: [
+            {
+                'uuid': row[primary_key],
+                'vin': row[vin_key],
+                'standard_version': standard_version,
+                'hash': hashes[standard_version][row[primary_key]],
+            }
+            for row in wanted[standard_version]
+        ]
+        for standard_version in standard_versions
+    }
+
+
+def hash_records(rows, serializer, standard_version, primary_key='id', vin_key='vin', workers=0, cache=None):
+    """
+    Build VinDB hash records for rows under a single standard version, see hash_records_by_standard.
+    """
+    return hash_records_by_standard(
+        rows, serializer, [standard_version], primary_key, vin_key, workers, cache
+    )[standard_version]
@@ -0,0 +1,100 @@
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+import atexit
+import copy
+import logging
+import os
+import sys
+
+import logstash
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.metrics import log_records_dropped
+
+# record attributes set by logging itself, never summarized
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({})))
+
+
+def summarize(value, max_items):
+    """
+    Long lists, like the ids of a batch, as their count and first and last items.
+    """
+    if isinstance(value, (list, tuple)) and len(value) > max_items:
+        return {'count': len(value), 'first': value[0], 'last': value[-1]}
+
+    return value
+
+
+class BufferedQueueHandler(QueueHandler):
+    """
+    Hand records to a QueueListener through a bounded queue, so slow handlers never block the caller.
+    Records that do not fit are dropped and counted, long extra lists are summarized before queueing.
+    """
+
+    def __init__(self, queue, max_extra_items=20):
+        super(BufferedQueueHandler, self).__init__(queue)
+        self.max_extra_items = max_extra_items
+        self.dropped = 0
+
+    def prepare(self, record):
+        # unlike QueueHandler.prepare the traceback stays in exc_info instead of the message,
+        # so the logstash formatter still sends it as its stack_trace field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        for name, value in list(vars(record).items()):
+            if name not in _RECORD_ATTRIBUTES:
+                setattr(record, name, summarize(value, self.max_extra_items))
+
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+            log_records_dropped.inc()
+
+
+class BufferedQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # wait for room in a full buffer instead of failing on stop
+        self.queue.put(self._sentinel)
+
+
+_listener = []
+
+
+def configure_logging():
+    """
+    Log the package to stdout and, through a buffered queue, to logstash. Safe to call more than once.
+    """
+    if _listener:
+        return
+
+    logger = logging.getLogger('vinchain_database_hasher')
+    logger.setLevel(logging.INFO)
+
+    listener = BufferedQueueListener(
+        Queue(maxsize=settings.log_queue_size),
+        logstash.TCPLogstashHandler(settings.logstash_host, settings.logstash_port,
+                                    message_type=settings.app_name, version=settings.logging_version),
+    )
+    handler = BufferedQueueHandler(listener.queue, settings.log_max_extra_items)
+    logger.addHandler(handler)
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+
+    listener.start()
+    atexit.register(listener.stop)
+    _listener.append(listener)
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _restart_listener(listener, handler))
+
+
+def _restart_listener(listener, handler):
+    # a forked child, like a backfill worker, has the buffer but not the thread that drains it
+    handler.queue = listener.queue = Queue(maxsize=listener.queue.maxsize)
+    listener._thread = None
+    listener.start()
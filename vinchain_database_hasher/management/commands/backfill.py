@@ -0,0 +1,94 @@
+from datetime import datetime
+from signal import signal, SIGINT, SIGTERM
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vinchain_database_hasher.backfill import Backfill, clear_plan, get_plan, save_plan
+from vinchain_database_hasher.checkpoint import get_checkpoint_store
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.sources import get_source
+from vinchain_database_hasher.tasks import get_checkpoint
+from vinchain_database_hasher.tracker import query_latest_id
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Hash a range of ids of one source in parallel shards, then move its checkpoint to the end of the range. '
+            'Run it again to resume an interrupted backfill')
+    backfill = None
+
+    def __init__(self, *args, **kwargs):
+        signal(SIGINT, self.stop_gracefully)
+        signal(SIGTERM, self.stop_gracefully)
+
+        super().__init__(*args, **kwargs)
+
+    def stop_gracefully(self, signum, frame):
+        _logger.warning('%s: Trying to stop', settings.app_name)
+
+        if self.backfill is not None:
+            self.backfill.stop()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='vehicle', help='Name of the source to backfill')
+        parser.add_argument('--start-id', type=int, help='Hash the ids after this one, the checkpoint by default')
+        parser.add_argument('--end-id', type=int, help='Hash the ids up to this one, the latest eligible id by default')
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--shards', type=int, help='Number of id ranges, 4 per process by default')
+
+        super(Command, self).add_arguments(parser)
+
+    def handle(self, *app_labels, **options):
+        if get_checkpoint_store() is None:
+            # shard progress lives there, and VinDB's last record means nothing while shards finish out of order
+            raise CommandError('The backfill needs the checkpoint_path setting')
+
+        source = get_source(options['source'])
+        # an interrupted backfill resumes with its saved range and shards, unless other ones are given
+        plan = get_plan(source.data_source)
+
+        if plan is not None:
+            start_id, end_id, shards = tuple(
+                value if value is not None else saved for value, saved in
+                zip((options['start_id'], options['end_id'], options['shards']), plan)
+            )
+
+            if (start_id, end_id, shards) != plan:
+                _logger.warning('%s: Backfill of %s ids %s-%s in %d shards is replaced, its progress is lost',
+                                settings.app_name, source.name, plan[0], plan[1], plan[2],
+                                extra={'data_source': source.data_source})
+                clear_plan(source, *plan)
+        else:
+            start_id = options['start_id'] if options['start_id'] is not None else get_checkpoint(source.data_source)
+            end_id = options['end_id'] if options['end_id'] is not None else query_latest_id(source)
+            shards = options['shards'] or 4 * options['processes']
+
+        if end_id <= start_id:
+            self.stdout.write('Nothing to backfill after id {}'.format(start_id))
+            return
+
+        save_plan(source.data_source, start_id, end_id, shards)
+        self.backfill = Backfill(source, start_id, end_id, shards, options['processes'])
+        pending_shards = self.backfill.pending_shards()
+
+        _logger.warning('%s: Backfill of %s ids %s-%s started, %d of %d shards pending', settings.app_name,
+                        source.name, start_id, end_id, len(pending_shards), len(self.backfill.shards),
+                        extra={'data_source': source.data_source})
+
+        hashed = self.backfill.run(self.report)
+        if not self.backfill.finished:
+            _logger.warning('%s: Backfill of %s stopped, %d shards pending. Hashed %d records', settings.app_name,
+                            source.name, len(self.backfill.pending_shards()), hashed,
+                            extra={'data_source': source.data_source})
+        else:
+            _logger.warning('%s: Backfill of %s finished, checkpoint at %s. Hashed %d records', settings.app_name,
+                            source.name, end_id, hashed, extra={'data_source': source.data_source})
+
+    def report(self, after_id, last_id, hashed):
+        self.stdout.write('{}:  Shard {}-{}: Hashed {} records'.format(
+            datetime.now().strftime('%Y-%m-%dT%H:%M:%S%Z'), after_id + 1, last_id, hashed)
+        )
@@ -0,0 +1,86 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from vinchain_database_hasher.benchmark import (
+    NullSigner,
+    QueryCounter,
+    generate_cars,
+    generate_children,
+    override_settings,
+    run_benchmark,
+    throwaway_database,
+)
+from vinchain_database_hasher.signer import use_signer
+from vinchain_database_hasher.stub import StubVinDBServer
+from vinchain_database_hasher.sources import get_source
+from vinchain_db.models import TblCarsOptions, TblCarsEquipment, TblCarsConditionReports
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hashing pipeline on synthetic rows against a stub VinDB server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='vehicle', help='Name of the source to benchmark')
+        parser.add_argument('--rows', type=int, default=10000, help='Number of synthetic vehicle rows')
+        parser.add_argument('--children', type=int, default=1,
+                            help='Options, equipment and condition reports rows per vehicle')
+        parser.add_argument('--junk-rate', type=float, default=0.0, help='Share of rows with an invalid VIN')
+        parser.add_argument('--batch-sizes', default='500,1000,5000',
+                            help='Comma separated max_size_hashed_batch values to run')
+        parser.add_argument('--latency', type=float, default=0.05, help='Stub VinDB latency per create call, s')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of failed stub create calls')
+        parser.add_argument('--hash-workers', type=int, default=0, help='Hashing process pool size')
+        parser.add_argument('--queue-size', type=int, default=1, help='Pipeline queue size, 0 runs sequentially')
+        parser.add_argument('--concurrency', type=int, default=1, help='Batches submitted at once')
+        parser.add_argument('--sign', action='store_true', help='Sign batches with the configured VinChain node')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+
+        super(Command, self).add_arguments(parser)
+
+    def handle(self, *app_labels, **options):
+        rnd = random.Random(options['seed'])
+        source = get_source(options['source']).copy(hash_workers=options['hash_workers'])
+        model = source.get_model()
+        children = (TblCarsOptions, TblCarsEquipment, TblCarsConditionReports) if source.enrich else ()
+
+        if not options['sign']:
+            use_signer(NullSigner())
+
+        query_counter = QueryCounter()
+
+        try:
+            with throwaway_database(model, *children), \
+                    StubVinDBServer(options['latency'], options['error_rate']) as stub, \
+                    override_settings(pipeline_queue_size=options['queue_size'],
+                                      submit_concurrency=options['concurrency']):
+                car_ids = generate_cars(model, options['rows'], rnd, options['junk_rate'], source.vin_key)
+
+                for child in children:
+                    generate_children(child, car_ids, options['children'], rnd)
+
+                self.stdout.write('Generated {} rows'.format(len(car_ids)))
+                query_counter.install()
+
+                for batch_size in [int(size) for size in options['batch_sizes'].split(',')]:
+                    self.report(run_benchmark(source, batch_size, stub.url, query_counter))
+        finally:
+            query_counter.uninstall()
+            use_signer(None)
+
+    def report(self, result):
+        if result['start_rss'] is None:
+            # the peak could not be reset, it includes the synthetic data and the previous passes
+            rss = 'process_peak_rss={:.1f}MB'.format(result['peak_rss'] / 2 ** 20)
+        else:
+            rss = 'peak_rss={:.1f}MB (+{:.1f}MB)'.format(
+                result['peak_rss'] / 2 ** 20, (result['peak_rss'] - result['start_rss']) / 2 ** 20
+            )
+
+        self.stdout.write(
+            'batch_size={batch_size} rows={rows} time={seconds:.2f}s rows/s={rows_per_second:.1f} '
+            'queries={queries} {rss}'.format(rss=rss, **result)
+        )
+
+        for stage, (seconds, calls) in sorted(result['stages'].items()):
+            self.stdout.write('    {:<10} {:>9.3f}s {:>9} calls'.format(stage, seconds, calls))
@@ -0,0 +1,64 @@
+from signal import signal, SIGINT, SIGTERM
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.delivery import get_dead_letter_store
+from vinchain_database_hasher.sources import get_sources
+from vinchain_database_hasher.tasks import resubmit_dead_letters
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Submit the records of the dead letter store to vindb again'
+    stop = [False]
+
+    def __init__(self, *args, **kwargs):
+        signal(SIGINT, self.stop_gracefully)
+        signal(SIGTERM, self.stop_gracefully)
+
+        super().__init__(*args, **kwargs)
+
+    def stop_gracefully(self, signum, frame):
+        _logger.warning('%s: Trying to stop', settings.app_name)
+        self.stop[0] = True
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sources', help='Comma separated names of the sources to resubmit, all configured sources by default'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records per create request')
+
+        super(Command, self).add_arguments(parser)
+
+    def handle(self, *app_labels, **options):
+        store = get_dead_letter_store()
+
+        if store is None:
+            raise CommandError('Resubmitting needs the dead_letter_path setting')
+
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        sources = get_sources()
+
+        if options['sources']:
+            names = options['sources'].split(',')
+            unknown = set(names) - set(source.name for source in sources)
+
+            if unknown:
+                raise CommandError('Unknown sources: {}'.format(', '.join(sorted(unknown))))
+
+            sources = [source for source in sources if source.name in names]
+
+        for source in sources:
+            if self.stop[0]:
+                break
+
+            acknowledged, refused = resubmit_dead_letters(source, self.stop, options['batch_size'])
+            self.stdout.write('{}: acknowledged={} refused={} left={}'.format(
+                source.name, acknowledged, refused, store.count(source.data_source)
+            ))
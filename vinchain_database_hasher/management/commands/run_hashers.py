@@ -0,0 +1,107 @@
+from signal import signal, SIGINT, SIGTERM
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.metrics import start_metrics_server
+from vinchain_database_hasher.offline import dry_run, report_lines
+from vinchain_database_hasher.scheduler import Scheduler
+from vinchain_database_hasher.sources import get_sources
+from vinchain_database_hasher.wakeup import install_notify_trigger
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Send vehicle hashes of all configured sources to vindb'
+    scheduler = None
+    stop = [False]
+
+    def __init__(self, *args, **kwargs):
+        signal(SIGINT, self.stop_gracefully)
+        signal(SIGTERM, self.stop_gracefully)
+
+        super().__init__(*args, **kwargs)
+
+    def stop_gracefully(self, signum, frame):
+        _logger.warning('%s: Trying to stop', settings.app_name)
+        self.stop[0] = True
+
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sources', help='Comma separated names of the sources to run, all configured sources by default'
+        )
+        parser.add_argument(
+            '--trigger', choices=('interval', 'watch', 'notify'),
+            help='How new cycles start, overrides the trigger of every source'
+        )
+        parser.add_argument(
+            '--install-triggers', action='store_true',
+            help='Create the PostgreSQL insert triggers used by the notify trigger mode'
+        )
+        parser.add_argument(
+            '--reconcile', action='store_true', help='Reconcile the local checkpoints with VinDB on startup'
+        )
+        parser.add_argument(
+            '--dry-run', metavar='PATH',
+            help='Hash once without signing or submitting, write the records to a gzip NDJSON file and report timings'
+        )
+        parser.add_argument(
+            '--start-id', type=int, help='Dry run start, the local checkpoint or 0 by default'
+        )
+        parser.add_argument(
+            '--metrics-port', type=int, help='Port of the local /metrics endpoint, 0 disables it',
+            default=settings.metrics_port
+        )
+
+        super(Command, self).add_arguments(parser)
+
+    def handle(self, *app_labels, **options):
+        sources = get_sources()
+
+        if options['sources']:
+            names = options['sources'].split(',')
+            unknown = set(names) - set(source.name for source in sources)
+
+            if unknown:
+                raise CommandError('Unknown sources: {}'.format(', '.join(sorted(unknown))))
+
+            sources = [source for source in sources if source.name in names]
+
+        if options['trigger']:
+            sources = [source.copy(trigger=options['trigger']) for source in sources]
+
+        if options['dry_run']:
+            results, stages = dry_run(sources, options['dry_run'], self.stop, options['start_id'])
+
+            for line in report_lines(results, stages):
+                self.stdout.write(line)
+
+            return
+
+        if options['install_triggers']:
+            for source in sources:
+                install_notify_trigger(source)
+
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'], settings.metrics_host)
+
+        _logger.warning('%s: Hashing started for %s', settings.app_name, ', '.join(s.name for s in sources))
+
+        self.scheduler = Scheduler(sources, options['reconcile'])
+        self.scheduler.start()
+        self.scheduler.wait()
+
+        failed = self.scheduler.failed
+
+        if failed:
+            raise CommandError('Hashing failed for {}'.format(
+                ', '.join('{} ({})'.format(runner.source.name, runner.error) for runner in failed)
+            ))
+
+        _logger.warning('%s: Hashing stopped', settings.app_name)
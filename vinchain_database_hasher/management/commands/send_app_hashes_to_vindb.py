@@ -6,16 +6,14 @@ from django.core.management.base import BaseCommand
 
 from vinchain_database_hasher.tasks import hash_rows, hash_rows_app
 from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.metrics import start_metrics_server
+from vinchain_database_hasher.offline import dry_run, report_lines
+from vinchain_database_hasher.sources import get_source
+from vinchain_database_hasher.wakeup import get_waiter
 
-import sys
 import logging
-import logstash
 
 _logger = logging.getLogger(__name__)
-_logger.setLevel(logging.INFO)
-_logger.addHandler(logstash.TCPLogstashHandler(settings.logstash_host, settings.logstash_port,
-                                               message_type=settings.app_name, version=settings.logging_version))
-_logger.addHandler(logging.StreamHandler(sys.stdout))
 
 _logger_extra = {
     'data_source': settings.webapp_data_source,
@@ -39,21 +37,59 @@ class Command(BaseCommand):
         parser.add_argument(
             '--interval', type=int, help='The interval with which new records will be checked', default=300
         )
+        parser.add_argument(
+            '--trigger', choices=('interval', 'watch', 'notify'), default='interval',
+            help='Start a new cycle after the interval, or as soon as new rows are seen'
+        )
+        parser.add_argument(
+            '--reconcile', action='store_true', help='Reconcile the local checkpoint with VinDB on startup'
+        )
+        parser.add_argument(
+            '--dry-run', metavar='PATH',
+            help='Hash once without signing or submitting, write the records to a gzip NDJSON file and report timings'
+        )
+        parser.add_argument(
+            '--start-id', type=int, help='Dry run start, the local checkpoint or 0 by default'
+        )
+        parser.add_argument(
+            '--metrics-port', type=int, help='Port of the local /metrics endpoint, 0 disables it',
+            default=settings.metrics_port
+        )
 
         super(Command, self).add_arguments(parser)
 
     def handle(self, *app_labels, **options):
         _logger.warning('%s: Hashing started', settings.app_name, extra=_logger_extra)
 
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'], settings.metrics_host)
+
+        if options['dry_run']:
+            results, stages = dry_run([get_source('webapp')], options['dry_run'], self.stop, options['start_id'])
+
+            for line in report_lines(results, stages):
+                self.stdout.write(line)
+
+            return
+
         try:
             interval = 0
+            reconcile = options['reconcile']
+            waiter = get_waiter(get_source('webapp'), options['trigger'])
+            state = {}
             while not self.stop[0]:
                 if interval == 0:
-                    hashed = hash_rows_app(self.stop)
+                    hashed = hash_rows_app(self.stop, reconcile, state)
+                    reconcile = False
                     interval += 1
                     self.stdout.write('{}:  Hashed {} records'.format(
                         datetime.now().strftime('%Y-%m-%dT%H:%M:%S%Z'), hashed)
                     )
+
+                    if waiter is not None:
+                        waiter.wait(state['latest_hashed'], self.stop)
+                        interval = 0
+                        continue
                 elif interval >= options['interval']:
                     interval = 0
                 else:
@@ -0,0 +1,47 @@
+from signal import signal, SIGINT, SIGTERM
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.offline import upload
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Submit the hash records of a dry run file to vindb'
+    stop = [False]
+
+    def __init__(self, *args, **kwargs):
+        signal(SIGINT, self.stop_gracefully)
+        signal(SIGTERM, self.stop_gracefully)
+
+        super().__init__(*args, **kwargs)
+
+    def stop_gracefully(self, signum, frame):
+        _logger.warning('%s: Trying to stop', settings.app_name)
+        self.stop[0] = True
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='gzip NDJSON file written by a --dry-run')
+        parser.add_argument('--batch-size', type=int, default=settings.max_size_hashed_batch or 1000,
+                            help='Records per create request, max_size_hashed_batch or 1000 by default')
+        parser.add_argument('--concurrency', type=int, default=4, help='Create requests in flight at once')
+
+        super(Command, self).add_arguments(parser)
+
+    def handle(self, *app_labels, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        start_time = time.perf_counter()
+        acknowledged = upload(options['path'], self.stop, options['batch_size'], options['concurrency'])
+        seconds = time.perf_counter() - start_time
+
+        for data_source, records in sorted(acknowledged.items()):
+            self.stdout.write('{}: acknowledged={} time={:.2f}s records/s={:.1f}'.format(
+                data_source, records, seconds, records / seconds if seconds else 0.0
+            ))
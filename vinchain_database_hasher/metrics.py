@@ -0,0 +1,222 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Lock, Thread
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels
+    )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value))
+
+
+class Metric(object):
+    kind = 'untyped'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = Lock()
+        self._values = {}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.kind),
+        ]
+
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(('{}_bucket'.format(self.name), key + (('le', _format_value(bound)),), cumulative))
+
+                samples.append(('{}_sum'.format(self.name), key, total))
+                samples.append(('{}_count'.format(self.name), key, cumulative))
+
+        return samples
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    'vinchain_hasher_stage_seconds', 'Time spent in a hashing stage per call.'
+))
+rows_fetched = registry.register(Counter(
+    'vinchain_hasher_rows_fetched_total', 'Rows read from the database.'
+))
+rows_filtered = registry.register(Counter(
+    'vinchain_hasher_rows_filtered_total', 'Rows skipped because of an invalid VIN.'
+))
+rows_hashed = registry.register(Counter(
+    'vinchain_hasher_rows_hashed_total', 'Rows hashed.'
+))
+rows_acknowledged = registry.register(Counter(
+    'vinchain_hasher_rows_acknowledged_total', 'Hash records acknowledged by VinDB.'
+))
+rows_dead_lettered = registry.register(Counter(
+    'vinchain_hasher_rows_dead_lettered_total', 'Hash records moved to the dead letter store after failed retries.'
+))
+hash_cache_hits = registry.register(Counter(
+    'vinchain_hasher_hash_cache_hits_total', 'Rows whose hash was reused from the local hash cache.'
+))
+log_records_dropped = registry.register(Counter(
+    'vinchain_hasher_log_records_dropped_total', 'Log records dropped because the logstash buffer was full.'
+))
+lag = registry.register(Gauge(
+    'vinchain_hasher_lag', 'Latest id in the database minus the latest hashed id.'
+))
+
+
+class StageTimings(object):
+    """
+    Cumulative wall time and number of calls per hashing stage, every recorded duration is observed
+    in the stage_seconds histogram as well.
+    Stages of the pipeline overlap, so the totals can add up to more than the elapsed time.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seconds = defaultdict(float)
+            self.calls = defaultdict(int)
+
+    def add(self, stage, seconds, calls=1):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += calls
+
+        stage_seconds.observe(seconds, stage=stage)
+
+    @contextmanager
+    def time(self, stage):
+        start_time = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start_time)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: (self.seconds[stage], self.calls[stage]) for stage in self.seconds}
+
+
+timings = StageTimings()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_servers = {}
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """
+    Serve the registry in the Prometheus text format on http://host:port/metrics from a daemon thread.
+    """
+    server = _servers.get((host, port))
+
+    if server is None:
+        server = _servers[(host, port)] = HTTPServer((host, port), _MetricsHandler)
+        Thread(target=server.serve_forever, name='hasher-metrics', daemon=True).start()
+
+    return server
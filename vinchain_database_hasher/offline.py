@@ -0,0 +1,170 @@
+from json import loads as json_loads
+from threading import Lock
+import gzip
+import time
+
+from vinchain_database_hasher.checkpoint import get_checkpoint_store
+from vinchain_database_hasher.delivery import get_delivery
+from vinchain_database_hasher.metrics import timings
+from vinchain_database_hasher.serialization import encode_payload
+from vinchain_database_hasher.sources import get_sources
+from vinchain_database_hasher.submitter import AsyncSubmitter
+from vinchain_database_hasher.tasks import hash_range, standard_checkpoint, submit_records
+
+
+class RecordWriter(object):
+    """
+    Hash records written to a gzip compressed NDJSON file, one record with its data source per line.
+    Every source starts with a line of the ids its standards start after, so an upload can move their checkpoints.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.written = 0
+        self._file = gzip.open(path, 'wb')
+        self._lock = Lock()
+
+    def start(self, data_source, after_ids):
+        after_ids = dict((str(standard_version), after_id) for standard_version, after_id in after_ids.items())
+        line = encode_payload({'data_source': data_source, 'after_ids': after_ids}) + b'\n'
+
+        with self._lock:
+            self._file.write(line)
+
+    def write(self, data_source, records):
+        with timings.time('write'):
+            lines = b''.join(encode_payload(dict(record, data_source=data_source)) + b'\n' for record in records)
+
+            with self._lock:
+                self._file.write(lines)
+                self.written += len(records)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_records(path):
+    with gzip.open(path, 'rb') as records_file:
+        for line in records_file:
+            if line.strip():
+                yield json_loads(line.decode('utf-8'))
+
+
+def dry_run(sources, path, stop_flag, start_id=None):
+    """
+    Fetch, enrich, filter and hash every source without signing or submitting, the records are written to path.
+    Every standard of a source starts after start_id, or after its local checkpoint or 0, and no checkpoint is saved.
+    Returns the number of rows and seconds per source name, and the stage timings.
+    """
+    store = get_checkpoint_store()
+    results = {}
+    timings.reset()
+
+    with RecordWriter(path) as writer:
+        for source in sources:
+            latest_hashed = start_id
+
+            if latest_hashed is None:
+                latest_hashed = (store.get(source.data_source) if store is not None else None) or 0
+
+            start_time = time.perf_counter()
+            rows = hash_range(source, stop_flag, latest_hashed, writer=writer, ignore_checkpoints=start_id is not None)
+            results[source.name] = (rows, time.perf_counter() - start_time)
+
+    return results, timings.snapshot()
+
+
+def report_lines(results, stages):
+    lines = []
+
+    for name, (rows, seconds) in sorted(results.items()):
+        lines.append('{}: records={} time={:.2f}s records/s={:.1f}'.format(
+            name, rows, seconds, rows / seconds if seconds else 0.0
+        ))
+
+    for stage, (seconds, calls) in sorted(stages.items()):
+        lines.append('    {:<10} {:>9.3f}s {:>9} calls'.format(stage, seconds, calls))
+
+    return lines
+
+
+def iter_upload_batches(path, batch_size, after_ids=None):
+    """
+    Records of a dry run file as ((data_source, standard_version), records) batches of at most batch_size records.
+    The start lines of the sources are collected in after_ids by (data_source, standard_version) as they are read.
+    """
+    key = None
+    batch = []
+
+    for record in iter_records(path):
+        if 'after_ids' in record:
+            if after_ids is not None:
+                for standard_version, after_id in record['after_ids'].items():
+                    after_ids[(record['data_source'], standard_version)] = after_id
+
+            continue
+
+        record_key = (record.pop('data_source'), record['standard_version'])
+
+        if batch and (record_key != key or len(batch) >= batch_size):
+            yield key, batch
+            batch = []
+
+        key = record_key
+        batch.append(record)
+
+    if batch:
+        yield key, batch
+
+
+def upload(path, stop_flag, batch_size=1000, concurrency=4):
+    """
+    Submit the records of a dry run file to VinDB with up to concurrency requests in flight.
+    The local checkpoint of every standard is moved over the submitted records when the dry run started at it,
+    so the hasher does not submit them again. Returns the number of acknowledged records per data source.
+    """
+    if batch_size <= 0:
+        raise ValueError('batch_size must be positive')
+
+    sources = dict((source.data_source, source) for source in get_sources())
+    store = get_checkpoint_store()
+    after_ids = {}
+    acknowledged = {}
+
+    def submit_batch(batch):
+        (data_source, standard_version), records = batch['records']
+
+        if data_source not in sources:
+            raise KeyError('No configured source submits to data source "{}"'.format(data_source))
+
+        delivery = get_delivery(
+            lambda records: submit_records(sources[data_source], records, records[-1]['uuid']),
+            stop_flag
+        )
+        batch['acknowledged'] = delivery.deliver(data_source, records)[0]
+
+    def complete_batch(batch):
+        (data_source, standard_version), records = batch['records']
+        acknowledged[data_source] = acknowledged.get(data_source, 0) + batch['acknowledged']
+
+        if store is None:
+            return
+
+        after_id = after_ids.get((data_source, str(standard_version)))
+        key = standard_checkpoint(data_source, standard_version, sources[data_source].get_standards())
+        checkpoint = store.get(key) or 0
+
+        # a dry run that started after the checkpoint left a gap, the hasher still has to fill it
+        if after_id is not None and after_id <= checkpoint < records[-1]['uuid']:
+            store.set(key, records[-1]['uuid'])
+
+    batches = ({'records': batch} for batch in iter_upload_batches(path, batch_size, after_ids))
+    AsyncSubmitter(stop_flag, concurrency).run(batches, submit_batch, complete_batch)
+
+    return acknowledged
@@ -0,0 +1,135 @@
+from contextlib import closing
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+
+from django.db import connections
+
+from vinchain_database_hasher.submitter import AsyncSubmitter
+
+
+_DONE = object()
+
+
+class _Failure(object):
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class Pipeline(object):
+    """
+    Run fetch, hash and submit stages connected by bounded queues.
+    Batches are produced and hashed in background threads while the calling thread submits them,
+    so batch N+1 is read and hashed while batch N is in flight.
+    With queue_size 0 the stages run one after another in the calling thread.
+    """
+
+    def __init__(self, stop_flag, queue_size=1, poll_interval=0.5):
+        self.stop_flag = stop_flag
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self._stopped = Event()
+
+    def stopping(self):
+        return self.stop_flag[0] or self._stopped.is_set()
+
+    def run(self, batches, hash_batch, submit_batch, complete_batch=None, concurrency=1):
+        """
+        Hash and submit every batch. complete_batch is called with each submitted batch in the batches order,
+        with concurrency > 1 the submissions overlap, see AsyncSubmitter.
+        """
+        with closing(self.iter_hashed(batches, hash_batch)) as hashed:
+            if concurrency > 1:
+                AsyncSubmitter(self.stop_flag, concurrency).run(hashed, submit_batch, complete_batch)
+                return
+
+            for batch in hashed:
+                submit_batch(batch)
+
+                if complete_batch is not None:
+                    complete_batch(batch)
+
+    def iter_hashed(self, batches, hash_batch):
+        if not self.queue_size:
+            for batch in batches:
+                if self.stopping():
+                    break
+
+                yield hash_batch(batch)
+
+            return
+
+        fetched = Queue(maxsize=self.queue_size)
+        hashed = Queue(maxsize=self.queue_size)
+        threads = [
+            Thread(target=self._produce, args=(batches, fetched), name='hasher-fetch', daemon=True),
+            Thread(target=self._transform, args=(hash_batch, fetched, hashed), name='hasher-hash', daemon=True),
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(hashed)
+
+                if item is _DONE:
+                    break
+
+                if isinstance(item, _Failure):
+                    raise item.exc
+
+                if self.stop_flag[0]:
+                    break
+
+                yield item
+        finally:
+            self._stopped.set()
+
+            for thread in threads:
+                thread.join()
+
+    def _put(self, queue, item):
+        while not self._stopped.is_set():
+            try:
+                queue.put(item, timeout=self.poll_interval)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    def _get(self, queue):
+        while True:
+            try:
+                return queue.get(timeout=self.poll_interval)
+            except Empty:
+                if self.stopping():
+                    return _DONE
+
+    def _produce(self, batches, out_queue):
+        try:
+            for batch in batches:
+                if self.stopping() or not self._put(out_queue, batch):
+                    break
+            else:
+                self._put(out_queue, _DONE)
+        except Exception as e:
+            self._put(out_queue, _Failure(e))
+        finally:
+            connections.close_all()
+
+    def _transform(self, func, in_queue, out_queue):
+        try:
+            while True:
+                item = self._get(in_queue)
+
+                if item is _DONE or isinstance(item, _Failure):
+                    self._put(out_queue, item)
+                    break
+
+                if not self._put(out_queue, func(item)):
+                    break
+        except Exception as e:
+            self._put(out_queue, _Failure(e))
+        finally:
+            connections.close_all()
@@ -0,0 +1,98 @@
+from threading import Thread
+import time
+
+from django.db import connections
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.tasks import hash_source
+from vinchain_database_hasher.wakeup import get_waiter
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class SourceRunner(Thread):
+    """
+    Hash one source every source.interval seconds, or whenever its waiter sees new rows, until stopped.
+    Each runner has its own stop flag and database connection; the VinDB client and signer are shared per process.
+    """
+
+    def __init__(self, source, reconcile=False, tick=1):
+        super(SourceRunner, self).__init__(name='hasher-{}'.format(source.name), daemon=True)
+        self.source = source
+        self.reconcile = reconcile
+        self.tick = tick
+        self.stop_flag = [False]
+        self.error = None
+        self.hashed = 0
+
+    def stop(self):
+        self.stop_flag[0] = True
+
+    def run(self):
+        extra = {'data_source': self.source.data_source}
+        _logger.warning('%s: Hashing of %s started', settings.app_name, self.source.name, extra=extra)
+
+        try:
+            waiter = get_waiter(self.source, self.source.trigger)
+            state = {}
+            next_run = 0
+
+            while not self.stop_flag[0]:
+                if time.time() >= next_run:
+                    hashed = hash_source(self.source, self.stop_flag, self.reconcile, state)
+                    self.reconcile = False
+                    self.hashed += hashed
+                    next_run = time.time() + self.source.interval
+                    _logger.info('%s: Hashed %d records of %s', settings.app_name, hashed, self.source.name,
+                                 extra=extra)
+
+                    if waiter is not None:
+                        waiter.wait(state['latest_hashed'], self.stop_flag)
+                        next_run = 0
+                        continue
+
+                time.sleep(self.tick)
+        except Exception as e:
+            self.error = e
+            _logger.exception('%s: Exception. Hashing of %s has stopped!!!', settings.app_name, self.source.name,
+                              extra=extra)
+        finally:
+            connections.close_all()
+
+        _logger.warning('%s: Hashing of %s stopped', settings.app_name, self.source.name, extra=extra)
+
+
+class Scheduler(object):
+    """
+    Run every source in its own SourceRunner thread.
+    When one runner fails the others are stopped too, so the process exits and its supervisor restarts it.
+    """
+
+    def __init__(self, sources, reconcile=False):
+        self.runners = [SourceRunner(source, reconcile) for source in sources]
+
+    def start(self):
+        for runner in self.runners:
+            runner.start()
+
+    def stop(self):
+        for runner in self.runners:
+            runner.stop()
+
+    def running(self):
+        return any(runner.is_alive() for runner in self.runners)
+
+    def wait(self, tick=1):
+        # join in short steps, so signal handlers still run in the main thread
+        while self.running():
+            if self.failed:
+                self.stop()
+
+            for runner in self.runners:
+                runner.join(tick)
+
+    @property
+    def failed(self):
+        return [runner for runner in self.runners if runner.error is not None]
@@ -0,0 +1,94 @@
+from json import (
+    dumps as json_dumps,
+)
+from random import random
+import time
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.metrics import timings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_payload(payload):
+    """
+    Encode payload to the JSON request body, orjson is used when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+
+    return json_dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def iter_payload(payload, records_key='hashes', chunk_records=500, ndjson=False):
+    """
+    Encode payload piece by piece, chunk_records records at a time, for a chunked request body.
+    As a JSON document the records are streamed inside the records_key array. As NDJSON the first line holds
+    the payload without the records and every following line one record.
+    """
+    envelope = dict((key, value) for key, value in payload.items() if key != records_key)
+    records = payload[records_key]
+
+    if ndjson:
+        yield encode_payload(envelope) + b'\n'
+
+        for start in range(0, len(records), chunk_records):
+            yield b''.join(encode_payload(record) + b'\n' for record in records[start:start + chunk_records])
+
+        return
+
+    # the envelope object is left open for the records array
+    head = encode_payload(envelope)[:-1] + b',' if envelope else b'{'
+    yield head + encode_payload(records_key) + b':['
+
+    for start in range(0, len(records), chunk_records):
+        yield (b',' if start else b'') + b','.join(
+            encode_payload(record) for record in records[start:start + chunk_records]
+        )
+
+    yield b']}'
+
+
+class PayloadStream(object):
+    """
+    Chunks of iter_payload for a streamed request body, counting the bytes and the encoding time as they are sent.
+    """
+
+    def __init__(self, payload, chunk_records=500, ndjson=False):
+        self.chunks = iter_payload(payload, chunk_records=chunk_records, ndjson=ndjson)
+        self.content_type = 'application/x-ndjson' if ndjson else 'application/json'
+        self.size = 0
+
+    def __iter__(self):
+        encode_time = 0.0
+
+        try:
+            while True:
+                start_time = time.perf_counter()
+                chunk = next(self.chunks, None)
+                encode_time += time.perf_counter() - start_time
+
+                if chunk is None:
+                    return
+
+                self.size += len(chunk)
+
+                yield chunk
+        finally:
+            timings.add('encode', encode_time)
+
+
+def dump_payload(body):
+    """
+    Print a sampled part of the request body, see payload_dump_rate and payload_dump_max_bytes.
+    """
+    if settings.payload_dump_rate and random() < settings.payload_dump_rate:
+        dumped = body[:settings.payload_dump_max_bytes].decode('utf-8', 'replace')
+
+        if len(body) > settings.payload_dump_max_bytes:
+            dumped += '... ({} bytes)'.format(len(body))
+
+        print(dumped)
@@ -0,0 +1,106 @@
+from datetime import datetime
+from threading import Lock
+import os
+import time
+
+from vinchainio.vinchain import VinChain
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.metrics import timings
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class Signer(object):
+    """
+    Long-lived VinChain connection with an unlocked wallet.
+    The connection is opened on first use and reopened once when signing fails on it.
+    """
+
+    def __init__(self, node, chain_id, wallet_password):
+        self.node = node
+        self.chain_id = chain_id
+        self.wallet_password = wallet_password
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+        self.signed = 0
+        self._blockchain = None
+        self._lock = Lock()
+
+    def connect(self):
+        blockchain = VinChain(
+            node=self.node,
+            blocking=True,
+            debug=False,
+            known_chains={
+                'VIN': {
+                    'chain_id': self.chain_id,
+                    'core_symbol': 'VIN',
+                    'prefix': 'VIN'
+                },
+            }
+        )
+        blockchain.wallet.unlock(self.wallet_password)
+        self._blockchain = blockchain
+
+        return blockchain
+
+    def reset(self):
+        self._blockchain = None
+
+    def _sign(self, subject):
+        blockchain = self._blockchain or self.connect()
+
+        return blockchain.get_message(
+            datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        ).sign(subject)
+
+    def sign(self, subject):
+        with self._lock:
+            start_time = time.time()
+
+            try:
+                try:
+                    return self._sign(subject)
+                except Exception as e:
+                    if self._blockchain is None:
+                        raise
+
+                    _logger.warning('%s: Signing failed, reconnecting to %s: %s', settings.app_name, self.node, e)
+                    self.reset()
+
+                    return self._sign(subject)
+            finally:
+                self.last_duration = time.time() - start_time
+                self.total_duration += self.last_duration
+                self.signed += 1
+                timings.add('sign', self.last_duration)
+
+
+_signers = {}
+_signer_override = [None]
+
+
+def use_signer(signer):
+    """
+    Make get_signer return signer instead of the VinChain one, None restores the default.
+    """
+    _signer_override[0] = signer
+
+
+def get_signer():
+    if _signer_override[0] is not None:
+        return _signer_override[0]
+
+    key = (os.getpid(), settings.vinchain_node, settings.vinchain_chain_id, settings.vinchain_wallet_password)
+    signer = _signers.get(key)
+
+    if signer is None:
+        _signers.clear()
+        signer = _signers[key] = Signer(
+            settings.vinchain_node, settings.vinchain_chain_id, settings.vinchain_wallet_password
+        )
+
+    return signer
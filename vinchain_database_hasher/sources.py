@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+
+from vinchain_database_hasher.conf import settings
+
+
+def import_from(path, name):
+    return getattr(
+        __import__(path, fromlist=[name]),
+        name
+    )
+
+
+_components = {}
+
+
+def resolve(component):
+    """
+    Object named by a (module path, name) pair, imported once per process. Objects are returned as they are.
+    """
+    if not isinstance(component, (tuple, list)):
+        return component
+
+    key = tuple(component)
+    resolved = _components.get(key)
+
+    if resolved is None:
+        resolved = _components[key] = import_from(*key)
+
+    return resolved
+
+
+class Source(object):
+    """
+    A hashed table and the VinDB data source its hashes are submitted to.
+    model and serializer are (module path, name) pairs, or the objects themselves.
+    trigger is how a new cycle starts after an idle one: 'interval', 'watch' or 'notify', see wakeup.get_waiter.
+
+    A serializer can declare the columns it reads in a fields attribute, and the columns of the enriched child
+    rows in a child_fields dict keyed by 'options', 'equipment' and 'condition_report'. Only those columns
+    are selected then, every column otherwise.
+    """
+
+    def __init__(self, name, model, data_source, serializer=('vinchain_database_hasher.tasks', 'dummy_serializer'),
+                 primary_key='id', vin_key='vin', hash_functions=0, use_hasher=False, hasher='', hash_workers=0,
+                 interval=300, trigger='interval', min_age_days=0, enrich=False, filter_vins=False,
+                 vin_filter_in_db=False):
+        self.name = name
+        self.model = model
+        self.data_source = data_source
+        self.serializer = serializer
+        self.primary_key = primary_key
+        self.vin_key = vin_key
+        self.hash_functions = hash_functions
+        self.use_hasher = use_hasher
+        self.hasher = hasher
+        self.hash_workers = hash_workers
+        self.interval = interval
+        self.trigger = trigger
+        self.min_age_days = min_age_days
+        self.enrich = enrich
+        self.filter_vins = filter_vins
+        self.vin_filter_in_db = vin_filter_in_db
+
+    def __repr__(self):
+        return '<Source {} ({})>'.format(self.name, self.data_source)
+
+    def copy(self, **changes):
+        config = dict(self.__dict__)
+        config.update(changes)
+
+        return Source(**config)
+
+    def get_model(self):
+        return resolve(self.model)
+
+    def get_standards(self):
+        """
+        Hash standard versions to compute, hash_functions is a single version or a list of them.
+        """
+        if isinstance(self.hash_functions, (tuple, list)):
+            return list(self.hash_functions)
+
+        return [self.hash_functions]
+
+    def get_queryset(self):
+        """
+        Rows that are old enough to be hashed.
+        """
+        queryset = self.get_model().objects.all()
+
+        if self.min_age_days:
+            queryset = queryset.filter(create_date__lt=datetime.now() - timedelta(days=self.min_age_days))
+
+        return queryset
+
+    def get_serializer(self):
+        return resolve(self.serializer)
+
+    def get_fields(self):
+        """
+        Columns to select for the serializer, None for all of them.
+        """
+        fields = getattr(self.get_serializer(), 'fields', None)
+
+        if not fields:
+            return None
+
+        # the hash records and the enrichment need these whatever the serializer reads
+        required = [self.primary_key, self.vin_key] + (['id'] if self.enrich else [])
+
+        fields = list(fields)
+
+        for field in required:
+            if field not in fields:
+                fields.append(field)
+
+        return fields
+
+    def get_child_fields(self):
+        return dict(getattr(self.get_serializer(), 'child_fields', None) or {})
+
+    @property
+    def signed_subject(self):
+        return self.hasher if self.use_hasher else self.data_source
+
+
+def _setting(name, default=None):
+    try:
+        return getattr(settings, name)
+    except KeyError:
+        return default
+
+
+def get_vehicle_source():
+    return Source(
+        name='vehicle',
+        model=settings.vehicle_model,
+        serializer=settings.vehicle_serializer,
+        data_source=settings.vindb_data_source,
+        primary_key=settings.vehicle_model_primary_key,
+        vin_key=settings.vehicle_model_vin_key,
+        hash_functions=settings.vindb_hash_functions,
+        use_hasher=settings.vindb_use_hasher,
+        hasher=settings.vindb_hasher,
+        hash_workers=settings.hash_workers,
+        min_age_days=3,
+        enrich=True,
+        filter_vins=True,
+        vin_filter_in_db=settings.vin_filter_in_db,
+    )
+
+
+def get_webapp_source():
+    return Source(
+        name='webapp',
+        model=settings.vehicle_model_app,
+        serializer=settings.vehicle_serializer_app,
+        data_source=settings.webapp_data_source,
+        hash_functions=settings.webapp_hash_functions,
+        use_hasher=_setting('webapp_use_hasher', False),
+        hasher=_setting('webapp_hasher', ''),
+        hash_workers=settings.webapp_hash_workers,
+    )
+
+
+def get_sources():
+    """
+    Sources from the sources setting, or the vehicle and webapp sources built from the vindb_* and webapp_* settings.
+    """
+    if settings.sources:
+        return [Source(**config) for config in settings.sources]
+
+    sources = [get_vehicle_source()]
+
+    if _setting('vehicle_model_app') and _setting('webapp_data_source'):
+        sources.append(get_webapp_source())
+
+    return sources
+
+
+def get_source(name):
+    for source in get_sources():
+        if source.name == name:
+            return source
+
+    if name == 'vehicle':
+        return get_vehicle_source()
+
+    if name == 'webapp':
+        return get_webapp_source()
+
+    raise KeyError('Unknown source "{}"'.format(name))
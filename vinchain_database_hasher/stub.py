@@ -0,0 +1,156 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import (
+    dumps as json_dumps,
+    loads as json_loads,
+)
+from random import random
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlparse
+import gzip
+import time
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubVinDBServer(object):
+    """
+    Local stand-in for the VinDB endpoints used by the hasher.
+    Every create request waits latency seconds and fails with error_status at error_rate,
+    accepted records are acknowledged and remembered per data source.
+    Create bodies can be gzip compressed, sent with chunked transfer encoding and be JSON or NDJSON.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=500, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self.received_bytes = 0
+        self.records = {}
+        self._lock = Lock()
+        self._server = _ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, name='stub-vindb', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def last(self, data_source):
+        with self._lock:
+            records = self.records.get(data_source)
+
+            return records[-1] if records else None
+
+    def create(self, payload):
+        time.sleep(self.latency)
+
+        with self._lock:
+            self.requests += 1
+
+            if self.error_rate and random() < self.error_rate:
+                self.errors += 1
+                return self.error_status, {'error': 'stub error'}
+
+            self.records.setdefault(payload['data_source'], []).extend(payload['hashes'])
+
+        return 201, {'records': [{'uuid': record['uuid']} for record in payload['hashes']]}
+
+    def read_body(self, handler):
+        if handler.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = self.read_chunks(handler.rfile)
+        else:
+            body = handler.rfile.read(int(handler.headers.get('Content-Length', 0)))
+
+        with self._lock:
+            self.received_bytes += len(body)
+
+        if handler.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+
+        return body
+
+    @staticmethod
+    def read_chunks(rfile):
+        chunks = []
+
+        while True:
+            size = int(rfile.readline().split(b';')[0].strip(), 16)
+
+            if not size:
+                # trailer headers up to the closing empty line
+                while rfile.readline().strip():
+                    pass
+
+                return b''.join(chunks)
+
+            chunks.append(rfile.read(size))
+            rfile.readline()
+
+    @staticmethod
+    def parse_payload(body, content_type):
+        if content_type.startswith('application/x-ndjson'):
+            lines = [json_loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+            payload = lines[0]
+            payload['hashes'] = lines[1:]
+
+            return payload
+
+        return json_loads(body.decode('utf-8'))
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def respond(self, status, data):
+                body = json_dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+
+                if url.path != '/vindb/vin_records/last/':
+                    return self.respond(404, {})
+
+                data_source = parse_qs(url.query).get('data_source', [''])[0]
+
+                self.respond(200, stub.last(data_source) or {})
+
+            def do_POST(self):
+                if urlparse(self.path).path != '/vindb/vin_records/create/':
+                    return self.respond(404, {})
+
+                payload = stub.parse_payload(stub.read_body(self), self.headers.get('Content-Type', ''))
+                self.respond(*stub.create(payload))
+
+        return Handler
@@ -0,0 +1,107 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+from django.db import connections
+
+
+_END = object()
+
+
+class AsyncSubmitter(object):
+    """
+    Submit up to concurrency batches at once from an asyncio event loop.
+    submit_batch runs in a thread pool with the blocking VinDB client and signer, complete_batch runs in the
+    calling thread in the batches order, so it only ever sees a contiguous prefix of submitted batches.
+    No batch is read before a submission slot is free, which holds back the hash and fetch stages.
+    """
+
+    def __init__(self, stop_flag, concurrency=4):
+        self.stop_flag = stop_flag
+        self.concurrency = concurrency
+        self.error = None
+
+    def run(self, batches, submit_batch, complete_batch=None):
+        loop = asyncio.new_event_loop()
+        submit_executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='hasher-submit')
+        # batches can block on the pipeline queues, so they are read off the event loop as well
+        read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hasher-read')
+
+        try:
+            loop.run_until_complete(
+                self._run(loop, submit_executor, read_executor, iter(batches), submit_batch, complete_batch)
+            )
+        finally:
+            submit_executor.shutdown(wait=True)
+            # reading runs the sequential pipeline stages, which query the database from the read thread
+            read_executor.submit(connections.close_all).result()
+            read_executor.shutdown(wait=True)
+            loop.close()
+
+        if self.error is not None:
+            raise self.error
+
+    async def _run(self, loop, submit_executor, read_executor, batches, submit_batch, complete_batch):
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight = deque()
+
+        def complete_prefix():
+            while in_flight and in_flight[0][1].done():
+                batch, task = in_flight[0]
+
+                if task.exception() is not None:
+                    # nothing after a failed batch is completed
+                    return
+
+                in_flight.popleft()
+
+                if complete_batch is not None:
+                    complete_batch(batch)
+
+        def on_done(task):
+            try:
+                complete_prefix()
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+
+        async def submit(batch):
+            try:
+                await loop.run_in_executor(submit_executor, submit_batch, batch)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+                raise
+            finally:
+                slots.release()
+
+        while self.error is None and not self.stop_flag[0]:
+            await slots.acquire()
+
+            if self.error is not None or self.stop_flag[0]:
+                slots.release()
+                break
+
+            try:
+                batch = await loop.run_in_executor(read_executor, next, batches, _END)
+            except Exception as e:
+                # a failed fetch or hash stage, the batches in flight are still completed
+                self.error = e
+                batch = _END
+
+            if batch is _END:
+                slots.release()
+                break
+
+            task = loop.create_task(submit(batch))
+            task.add_done_callback(on_done)
+            in_flight.append((batch, task))
+
+        if in_flight:
+            await asyncio.wait([task for batch, task in in_flight])
+
+            for batch, task in in_flight:
+                # the error is raised once from run, the rest are only retrieved
+                task.exception()
+
+        complete_prefix()
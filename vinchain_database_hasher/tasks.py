@@ -1,403 +1,546 @@
-from datetime import datetime, timedelta
+from itertools import islice
+from threading import local
 import time
 from json import (
     dumps as json_dumps,
 )
-from requests import (
-    get as requests_get,
-    post as requests_post,
-)
 
 from time import sleep
-from vinchainio.vinchain import VinChain
-from vinchain_hashing import hash_functions
 
+from vinchain_database_hasher.batching import get_batch_size, iter_batches
+from vinchain_database_hasher.checkpoint import get_checkpoint_store
+from vinchain_database_hasher.client import get_client
 from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.delivery import SubmitError, get_dead_letter_store, get_delivery
+from vinchain_database_hasher.hashcache import get_hash_cache
+from vinchain_database_hasher.hashing import hash_records_by_standard
+from vinchain_database_hasher.metrics import (
+    lag, rows_acknowledged, rows_dead_lettered, rows_fetched, rows_filtered, rows_hashed, timings,
+)
+from vinchain_database_hasher.pipeline import Pipeline
+from vinchain_database_hasher.serialization import PayloadStream, dump_payload, encode_payload
+from vinchain_database_hasher.signer import get_signer
+from vinchain_database_hasher.sources import get_source
+from vinchain_database_hasher.tracker import get_latest_id_tracker
+from vinchain_database_hasher.vin import VinFilter
 from vinchain_db.models import TblCarsOptions, TblCarsEquipment, TblCarcheck, TblCarsConditionReports
 from vinchain_db.serializers import CarCheckSchema, OptionsSchema, EquipmentSchema, ConditionSchema
 
-import sys
 import logging
-import logstash
-import re
 
 _logger = logging.getLogger(__name__)
-_logger.setLevel(logging.INFO)
-_logger.addHandler(logstash.TCPLogstashHandler(settings.logstash_host, settings.logstash_port,
-                                               message_type=settings.app_name, version=settings.logging_version))
-_logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
 def get_vehicle_model():
-    path, model_name = settings.vehicle_model
-    return getattr(
-        __import__(path, fromlist=[model_name]),
-        model_name
-    )
+    return get_source('vehicle').get_model()
 
 
 def get_vehicle_serializer():
-    path, serializer = settings.vehicle_serializer
-    return getattr(
-        __import__(path, fromlist=[serializer]),
-        serializer
-    )
+    return get_source('vehicle').get_serializer()
 
 
 def get_vehicle_model_app():
-    path, model_name = settings.vehicle_model_app
-    return getattr(
-        __import__(path, fromlist=[model_name]),
-        model_name
-    )
+    return get_source('webapp').get_model()
 
 
 def get_vehicle_serializer_app():
-    path, serializer = settings.vehicle_serializer_app
-    return getattr(
-        __import__(path, fromlist=[serializer]),
-        serializer
-    )
+    return get_source('webapp').get_serializer()
 
 
 def get_last_sent_id():
-    row = requests_get(
-        '{}/vindb/vin_records/last/'.format(settings.vindb_host),
-        params={
-            'data_source': settings.vindb_data_source,
-        },
-        headers={
-            'Content-Type': 'application/json'
-        }
-    ).json()
-
-    return row.get('uuid', 0)
+    return get_client().get_last_sent_id(settings.vindb_data_source)
 
 
 def get_last_sent_id_app():
-    row = requests_get(
-        '{}/vindb/vin_records/last/'.format(settings.vindb_host),
-        params={
-            'data_source': settings.webapp_data_source,
-        },
-        headers={
-            'Content-Type': 'application/json'
-        }
-    ).json()
+    return get_client().get_last_sent_id(settings.webapp_data_source)
 
-    return row.get('uuid', 0)
 
+def get_checkpoint(data_source, reconcile=False):
+    """
+    Latest acknowledged uuid for data_source.
+    The local checkpoint is used when it exists, VinDB is asked only when it is missing or reconcile is set.
+    """
+    store = get_checkpoint_store()
 
-def get_new_rows(model, latest_hashed_id, qty_rows):
-    dt = datetime.now() - timedelta(days=3)
-    new_rows = list(
-        model.objects.values().filter(
-            id__gt=latest_hashed_id, create_date__lt=dt
-        ).order_by(settings.vehicle_model_primary_key)[:qty_rows]
+    if store is None:
+        return get_client().get_last_sent_id(data_source)
+
+    latest_hashed = store.get(data_source)
+
+    if latest_hashed is None or reconcile:
+        remote_latest_hashed = get_client().get_last_sent_id(data_source)
+
+        if remote_latest_hashed or latest_hashed is None:
+            latest_hashed = remote_latest_hashed
+            store.set(data_source, latest_hashed)
+
+    return latest_hashed
+
+
+def get_standard_checkpoint(checkpoint, default=0):
+    """
+    Local checkpoint of an additional hash standard. VinDB only knows the latest record of a data source,
+    so without a local checkpoint the standard starts after default.
+    """
+    store = get_checkpoint_store()
+    latest_hashed = store.get(checkpoint) if store is not None else None
+
+    return default if latest_hashed is None else latest_hashed
+
+
+def set_checkpoint(data_source, latest_hashed):
+    store = get_checkpoint_store()
+
+    if store is not None:
+        store.set(data_source, latest_hashed)
+
+
+def first_by_car_id(rows):
+    """
+    The first child row of every car, the only one the enrichment uses.
+    """
+    first = {}
+
+    for row in rows:
+        first.setdefault(row['car_id'], row)
+
+    return first
+
+
+_schemas = local()
+
+
+def get_schema(schema_class):
+    """
+    Schema instance reused by every batch of the current thread.
+    """
+    schemas = getattr(_schemas, 'instances', None)
+
+    if schemas is None:
+        schemas = _schemas.instances = {}
+
+    schema = schemas.get(schema_class)
+
+    if schema is None:
+        schema = schemas[schema_class] = schema_class()
+
+    return schema
+
+
+def enrich_rows(rows, child_fields=None):
+    with timings.time('enrich'):
+        return _enrich_rows(rows, child_fields or {})
+
+
+def _child_rows(model, car_ids, fields=None):
+    # the first row of a car is the one with the lowest pk, like the former per car queries returned it
+    queryset = model.objects.filter(car_id__in=car_ids).order_by('car_id', 'pk')
+
+    if fields:
+        return queryset.values('car_id', *[field for field in fields if field != 'car_id'])
+
+    return queryset.values()
+
+
+def _enrich_rows(rows, child_fields):
+    car_ids = [row['id'] for row in rows]
+
+    if not car_ids:
+        return rows
+
+    options = first_by_car_id(_child_rows(TblCarsOptions, car_ids, child_fields.get('options')))
+    equipment = first_by_car_id(_child_rows(TblCarsEquipment, car_ids, child_fields.get('equipment')))
+    condition_reports = first_by_car_id(
+        _child_rows(TblCarsConditionReports, car_ids, child_fields.get('condition_report'))
     )
 
-    for result in new_rows:
+    options_schema = get_schema(OptionsSchema)
+    equipment_schema = get_schema(EquipmentSchema)
+    condition_schema = get_schema(ConditionSchema)
+
+    for result in rows:
         car_id = result['id']
 
         try:
-            opt_data = list(TblCarsOptions.objects.filter(car_id=car_id).values())
+            opt_data = options.get(car_id)
 
-            if len(opt_data):
-                schema = OptionsSchema(many=True)
-                opt = schema.dump(opt_data).data
-                result['options'] = opt[0]['options']
+            if opt_data:
+                result['options'] = options_schema.dump(opt_data).data['options']
 
-            eq_data = list(TblCarsEquipment.objects.filter(car_id=car_id).values())
+            eq_data = equipment.get(car_id)
 
-            if len(eq_data):
-                schema = EquipmentSchema(many=True)
-                eq = schema.dump(eq_data).data
-                result['equipment'] = eq[0]['equipment']
+            if eq_data:
+                result['equipment'] = equipment_schema.dump(eq_data).data['equipment']
 
-            cr_data = list(TblCarsConditionReports.objects.filter(car_id=car_id).values())
+            cr_data = condition_reports.get(car_id)
 
-            if len(cr_data):
-                schema = ConditionSchema(many=True)
-                cr = schema.dump(cr_data).data
-                result['condition_report'] = cr[0]['reports']
+            if cr_data:
+                result['condition_report'] = condition_schema.dump(cr_data).data['reports']
 
         except Exception as e:
             print(e)
 
-    return new_rows
+    return rows
+
+
+def iter_row_chunks(queryset, primary_key, latest_hashed_id, chunk_size):
+    """
+    Walk queryset in primary key order starting after latest_hashed_id.
+    Every chunk is loaded at once by its own keyset query, so at most chunk_size rows are held in memory.
+    """
+    while True:
+        with timings.time('fetch'):
+            chunk = list(
+                queryset.filter(**{'{}__gt'.format(primary_key): latest_hashed_id})
+                    .order_by(primary_key)[:chunk_size]
+            )
+
+        if not len(chunk):
+            return
+
+        yield chunk
+
+        if len(chunk) < chunk_size:
+            return
+
+        latest_hashed_id = chunk[-1][primary_key]
+
+
+def iter_source_rows(source, latest_hashed_id, chunk_size, vin_filter=None, last_id=None):
+    queryset = source.get_queryset().values(*source.get_fields() or ())
+
+    if last_id is not None:
+        queryset = queryset.filter(**{'{}__lte'.format(source.primary_key): last_id})
+
+    if vin_filter is not None and source.vin_filter_in_db:
+        queryset = vin_filter.filter_queryset(queryset)
+
+    child_fields = source.get_child_fields()
+
+    for chunk in iter_row_chunks(queryset, source.primary_key, latest_hashed_id, chunk_size):
+        if source.enrich:
+            chunk = enrich_rows(chunk, child_fields)
+
+        for row in chunk:
+            yield row
+
+
+def iter_new_rows(model, latest_hashed_id, chunk_size, vin_filter=None):
+    return iter_source_rows(get_source('vehicle').copy(model=model), latest_hashed_id, chunk_size, vin_filter)
+
+
+def iter_new_rows_app(model, latest_hashed_id, chunk_size):
+    return iter_source_rows(get_source('webapp').copy(model=model), latest_hashed_id, chunk_size)
+
+
+def get_new_rows(model, latest_hashed_id, qty_rows):
+    return list(islice(iter_new_rows(model, latest_hashed_id, qty_rows), qty_rows))
 
 
 def get_new_rows_app(model, latest_hashed_id, qty_rows):
-    new_rows = list(
-        model.objects.values().filter(id__gt=latest_hashed_id)
-            .order_by(settings.vehicle_model_primary_key)[:qty_rows]
-    )
+    return list(islice(iter_new_rows_app(model, latest_hashed_id, qty_rows), qty_rows))
+
 
-    return new_rows
+def get_source_latest_id(source, model=None):
+    if model is not None:
+        source = source.copy(model=model)
+
+    return get_latest_id_tracker(source).get()
 
 
 def get_latest_id(model):
-    return int(getattr(model.objects.latest(settings.vehicle_model_primary_key), settings.vehicle_model_primary_key, 0))
+    return get_source_latest_id(get_source('vehicle'), model)
 
 
 def get_latest_id_app(model):
-    return int(getattr(model.objects.latest('id'), 'id', 0))
+    return get_source_latest_id(get_source('webapp'), model)
 
 
 def dummy_serializer(row):
     return row
 
 
-def hash_rows(stop_flag):
-    latest_hashed = get_last_sent_id()
+def _body_size(body):
+    return body.size if isinstance(body, PayloadStream) else len(body)
 
-    print(latest_hashed)
 
-    have_new_rows = True
-    hashed_rows = 0
-
-    model = get_vehicle_model()
-    serializer = get_vehicle_serializer()
-
-    while not stop_flag[0] and have_new_rows:
-        latest_id = get_latest_id(model)
-        new_rows = get_new_rows(model, latest_hashed, settings.max_size_hashed_batch)
-        records = []
-
-        if not len(new_rows):
-            have_new_rows = False
-
-        for new_row in new_rows:
-            if new_row['vin'] is None:
-                continue
-
-            if len(new_row['vin']) > 17:
-                continue
-
-            # if new_row['create_date'] > datetime.now() - timedelta(days=3):
-            #     continue
-
-            if not re.match(r'^[a-zA-Z0-9\-]+$', new_row['vin']):
-                continue
-
-            latest_hashed = new_row[settings.vehicle_model_primary_key]
-            hashed_rows += 1
-
-            records.append({
-                'uuid': new_row[settings.vehicle_model_primary_key],
-                'vin': new_row[settings.vehicle_model_vin_key],
-                'standard_version': settings.vindb_hash_functions,
-                'hash': hash_functions[
-                    settings.vindb_hash_functions
-                ](serializer(new_row))
-            })
-
-        if len(records):
-            blockchain = VinChain(
-                node=settings.vinchain_node,
-                blocking=True,
-                debug=False,
-                known_chains={
-                    'VIN': {
-                        'chain_id': settings.vinchain_chain_id,
-                        'core_symbol': 'VIN',
-                        'prefix': 'VIN'
-                    },
-                }
-            )
-            blockchain.wallet.unlock(settings.vinchain_wallet_password)
-
-            payload = {
-                'signature': blockchain.get_message(
-                    datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                ).sign(
-                    settings.vindb_hasher if settings.vindb_use_hasher else settings.vindb_data_source
-                ),
-                'data_source': settings.vindb_data_source,
-                'hashes': records
-            }
+def submit_records(source, records, latest_id, batch_size=None, extra=None):
+    signer = get_signer()
 
-            if settings.vindb_use_hasher:
-                payload['hasher'] = settings.vindb_hasher
+    payload = {
+        'signature': signer.sign(source.signed_subject),
+        'data_source': source.data_source,
+        'hashes': records
+    }
 
-            start_time = time.time()
+    if source.use_hasher:
+        payload['hasher'] = source.hasher
 
-            print(json_dumps(payload))
+    start_time = time.time()
 
-            response = requests_post(
-                '{}/vindb/vin_records/create/'.format(settings.vindb_host),
-                data=json_dumps(payload),
-                headers={
-                    'Content-Type': 'application/json'
-                }, timeout=120
-            )
+    if settings.vindb_stream:
+        body = PayloadStream(payload, settings.vindb_stream_chunk_records, settings.vindb_stream == 'ndjson')
+        content_type = body.content_type
+    else:
+        with timings.time('encode'):
+            body = encode_payload(payload)
 
-            extra = {
-                'data_source': settings.vindb_data_source,
-                'hash_functions': settings.vindb_hash_functions,
-                'latest_hashed_id': latest_hashed,
-                'latest_id': latest_id,
-                'success': response.status_code == 201,
-            }
+        dump_payload(body)
+        content_type = None
 
-            if response.status_code != 201:  # error
-                extra['result'] = json_dumps({'status_code': response.status_code, 'response': response.text}),
-                _logger.error('%s:  %d rows processed unsuccessfully (ids %s-%s). Status code: %s. Error: "%s"',
-                              settings.app_name, len(records),
-                              records[0]['uuid'], records[-1]['uuid'], response.status_code, response.text, extra=extra)
-                raise Exception('Rows have not been stored in DB. Status code: {}. Error: "{}"'.format(
-                    response.status_code, response.text)
-                )
-
-            # success
-            hashed_records = response.json()['records']
-            # check if all records stored in DB
-            rs = len(hashed_records) == len(records)
-            extra.update(
-                {
-                    'success': rs,
-                    'hashed_rows': len(hashed_records),
-                    'hashed_rows_ids': [r['uuid'] for r in hashed_records],
-                    'tried_hash_rows_ids': [r['uuid'] for r in records] if not rs else None,
-                    'result': json_dumps({'status_code': response.status_code}),
-                }
-            )
-            if rs:
-                _logger.info('%s: %d rows processed successfully (ids %s-%s)', settings.app_name, len(hashed_records),
-                             hashed_records[0]['uuid'], hashed_records[-1]['uuid'], extra=extra)
-            else:
-                if len(hashed_records):
-                    _logger.info('%s: %d of %d rows processed successfully (ids %s-%s)', settings.app_name,
-                                 len(hashed_records), len(records), hashed_records[0]['uuid'],
-                                 hashed_records[-1]['uuid'],
-                                 extra=extra)
-                # _logger.error('%s: Not all rows have been stored in DB. '
-                #               'Only %d from %d rows processed successfully (ids %s-%s)',
-                #               settings.app_name, len(hashed_records), len(records),
-                #               hashed_records[0]['uuid'], hashed_records[-1]['uuid'], extra=extra)
-                # raise Exception('Not all rows have been created. Status code: {}. Hashed rows ids: "{}". '
-                #                 'Tried to hash rows ids: "{}"'.format(response.status_code, extra['hashed_rows_ids'],
-                #                                                       extra['tried_hash_rows_ids']))
-
-            print('--- {} seconds ---'.format(time.time() - start_time))
-
-    return hashed_rows
-
-
-def hash_rows_app(stop_flag):
-    latest_hashed = get_last_sent_id_app()
+    try:
+        with timings.time('post'):
+            response = get_client().create_records(body, content_type)
+    except Exception:
+        if batch_size is not None:
+            batch_size.update(time.time() - start_time, None, _body_size(body))
+        raise
+
+    if batch_size is not None:
+        batch_size.update(time.time() - start_time, response.status_code, _body_size(body))
+
+    extra = dict(extra or {})
+    extra.update(
+        {
+            'data_source': source.data_source,
+            'hash_functions': records[0]['standard_version'],
+            'latest_hashed_id': records[-1]['uuid'],
+            'latest_id': latest_id,
+            'sign_seconds': signer.last_duration,
+            'batch_size': batch_size() if batch_size is not None else len(records),
+            'success': response.status_code == 201,
+        }
+    )
+
+    if response.status_code != 201:  # error
+        extra['result'] = json_dumps({'status_code': response.status_code, 'response': response.text}),
+        _logger.error('%s:  %d rows processed unsuccessfully (ids %s-%s). Status code: %s. Error: "%s"',
+                      settings.app_name, len(records),
+                      records[0]['uuid'], records[-1]['uuid'], response.status_code, response.text, extra=extra)
+        raise SubmitError('Rows have not been stored in DB. Status code: {}. Error: "{}"'.format(
+            response.status_code, response.text), response.status_code
+        )
+
+    # success
+    hashed_records = response.json()['records']
+    rows_acknowledged.inc(len(hashed_records), data_source=source.data_source)
+    # check if all records stored in DB
+    rs = len(hashed_records) == len(records)
+    extra.update(
+        {
+            'success': rs,
+            'hashed_rows': len(hashed_records),
+            'hashed_rows_ids': [r['uuid'] for r in hashed_records],
+            'tried_hash_rows_ids': [r['uuid'] for r in records] if not rs else None,
+            'result': json_dumps({'status_code': response.status_code}),
+        }
+    )
+    if rs:
+        _logger.info('%s: %d rows processed successfully (ids %s-%s)', settings.app_name, len(hashed_records),
+                     hashed_records[0]['uuid'], hashed_records[-1]['uuid'], extra=extra)
+    else:
+        if len(hashed_records):
+            _logger.info('%s: %d of %d rows processed successfully (ids %s-%s)', settings.app_name,
+                         len(hashed_records), len(records), hashed_records[0]['uuid'],
+                         hashed_records[-1]['uuid'],
+                         extra=extra)
+
+    print('--- {} seconds ---'.format(time.time() - start_time))
+
+    return hashed_records
+
+
+def hash_source(source, stop_flag, reconcile=False, state=None):
+    """
+    Hash and submit all new rows of source, returns the number of submitted records.
+    The latest hashed id is left in state['latest_hashed'] when a state dict is passed.
+    """
+    latest_hashed = get_checkpoint(source.data_source, reconcile)
 
     print(latest_hashed)
 
-    have_new_rows = True
-    hashed_rows = 0
-
-    model = get_vehicle_model_app()
-    serializer = get_vehicle_serializer_app()
-
-    while not stop_flag[0] and have_new_rows:
-        latest_id = get_latest_id_app(model)
-        new_rows = get_new_rows_app(model, latest_hashed, settings.max_size_hashed_batch)
-        records = []
-
-        if not len(new_rows):
-            have_new_rows = False
-
-        for new_row in new_rows:
-            latest_hashed = new_row['id']
-            hashed_rows += 1
-
-            records.append({
-                'uuid': new_row['id'],
-                'vin': new_row['vin'],
-                'standard_version': settings.webapp_hash_functions,
-                'hash': hash_functions[
-                    settings.webapp_hash_functions
-                ](serializer(new_row))
-            })
-
-        if len(records):
-            blockchain = VinChain(
-                node=settings.vinchain_node,
-                blocking=True,
-                debug=False,
-                known_chains={
-                    'VIN': {
-                        'chain_id': settings.vinchain_chain_id,
-                        'core_symbol': 'VIN',
-                        'prefix': 'VIN'
-                    },
-                }
-            )
-            blockchain.wallet.unlock(settings.vinchain_wallet_password)
-
-            print(settings.webapp_hasher if settings.webapp_use_hasher else settings.webapp_data_source)
-
-            payload = {
-                'signature': blockchain.get_message(
-                    datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                ).sign(
-                    settings.webapp_hasher if settings.webapp_use_hasher else settings.webapp_data_source
-                ),
-                'data_source': settings.webapp_data_source,
-                'hashes': records
+    return hash_range(source, stop_flag, latest_hashed, state=state)
+
+
+def standard_checkpoint(checkpoint, standard_version, standard_versions):
+    """
+    Checkpoint key of a standard, the first standard keeps the plain key so a single standard source is unchanged.
+    """
+    if standard_version == standard_versions[0]:
+        return checkpoint
+
+    return '{}:standard:{}'.format(checkpoint, standard_version)
+
+
+def hash_range(source, stop_flag, latest_hashed, last_id=None, checkpoint=None, state=None, first_id=0,
+               writer=None, ignore_checkpoints=False):
+    """
+    Hash and submit the rows of source after latest_hashed up to last_id, or all of them.
+    Progress is saved under the checkpoint key, the data source by default.
+    With several hash standards the rows are read once and every standard continues from its own checkpoint,
+    a standard without one starts after first_id. Only the first standard can fall back to VinDB's latest record.
+    With ignore_checkpoints every standard starts after latest_hashed.
+    With a RecordWriter the records are written instead of submitted, and no checkpoint is saved.
+    """
+    checkpoint = checkpoint or source.data_source
+    standard_versions = source.get_standards()
+    checkpoints = {
+        standard_version: standard_checkpoint(checkpoint, standard_version, standard_versions)
+        for standard_version in standard_versions
+    }
+    if ignore_checkpoints:
+        after_ids = dict.fromkeys(standard_versions, latest_hashed)
+    else:
+        # without a checkpoint store the other standards can only follow the first one
+        default = first_id if get_checkpoint_store() is not None else latest_hashed
+        after_ids = {standard_version: get_standard_checkpoint(checkpoints[standard_version], default)
+                     for standard_version in standard_versions[1:]}
+        after_ids[standard_versions[0]] = latest_hashed
+    # moved by complete_batch, after_ids stay as they were when the pass started
+    standard_latest_hashed = dict(after_ids)
+
+    state = state if state is not None else {}
+    state.update({'hashed_rows': 0, 'latest_hashed': min(after_ids.values())})
+
+    if writer is not None:
+        writer.start(source.data_source, after_ids)
+
+    serializer = source.get_serializer()
+    latest_id_tracker = get_latest_id_tracker(source)
+    batch_size = get_batch_size(source.data_source)
+    vin_filter = VinFilter(source.vin_key) if source.filter_vins else None
+    hash_cache = get_hash_cache()
+
+    def fetch_batches():
+        rows = iter_source_rows(source, state['latest_hashed'],
+                                settings.db_chunk_size or settings.max_size_hashed_batch, vin_filter, last_id)
+
+        for batch in iter_batches(rows, batch_size):
+            batch = list(batch)
+            new_rows = list(vin_filter.filter(batch)) if vin_filter is not None else batch
+            rows_fetched.inc(len(batch), data_source=source.data_source)
+            rows_filtered.inc(len(batch) - len(new_rows), data_source=source.data_source)
+
+            yield {
+                'latest_id': latest_id_tracker.get(),
+                'last_id': batch[-1][source.primary_key],
+                'rows': new_rows,
             }
 
-            if settings.webapp_use_hasher:
-                payload['hasher'] = settings.webapp_hasher
+    def hash_batch(batch):
+        batch['records'] = hash_records_by_standard(
+            batch.pop('rows'),
+            serializer,
+            standard_versions,
+            primary_key=source.primary_key,
+            vin_key=source.vin_key,
+            workers=source.hash_workers,
+            cache=hash_cache,
+            after_ids=after_ids,
+        )
+        rows_hashed.inc(sum(len(records) for records in batch['records'].values()), data_source=source.data_source)
+
+        return batch
+
+    def submit_records_batch(batch, records):
+        delivery = get_delivery(
+            lambda records: submit_records(
+                source, records, batch['latest_id'], batch_size,
+                extra={'rejected_rows': dict(vin_filter.rejected)} if vin_filter is not None else None
+            ),
+            stop_flag
+        )
+        acknowledged, dead_lettered = delivery.deliver(source.data_source, records)
+
+        if dead_lettered:
+            rows_dead_lettered.inc(dead_lettered, data_source=source.data_source)
+            _logger.error('%s: %d rows moved to the dead letter store (ids %s-%s)', settings.app_name,
+                          dead_lettered, records[0]['uuid'], records[-1]['uuid'],
+                          extra={'data_source': source.data_source})
+
+        return acknowledged
+
+    def submit_batch(batch):
+        if writer is not None:
+            for records in batch['records'].values():
+                writer.write(source.data_source, records)
+
+            batch['acknowledged'] = sum(len(records) for records in batch['records'].values())
+            return
+
+        # one submission per standard
+        batch['acknowledged'] = sum(
+            submit_records_batch(batch, records) for records in batch['records'].values() if len(records)
+        )
+
+    def complete_batch(batch):
+        state['hashed_rows'] += batch['acknowledged']
+
+        # rows with invalid VINs are skipped for good, so the checkpoints move past them too
+        for standard_version in standard_versions:
+            if batch['last_id'] > standard_latest_hashed[standard_version]:
+                standard_latest_hashed[standard_version] = batch['last_id']
+
+                if writer is None:
+                    set_checkpoint(checkpoints[standard_version], batch['last_id'])
+
+        state['latest_hashed'] = min(standard_latest_hashed.values())
+        # latest_id is cached for a while, meanwhile latest_hashed can pass it
+        lag.set(max(batch['latest_id'] - state['latest_hashed'], 0), data_source=source.data_source)
+
+    # records are written in the order of the rows, an upload moves checkpoints over them in file order
+    concurrency = settings.submit_concurrency if writer is None else 1
+
+    Pipeline(stop_flag, settings.pipeline_queue_size).run(
+        fetch_batches(), hash_batch, submit_batch, complete_batch, concurrency
+    )
 
-            start_time = time.time()
+    if vin_filter is not None and vin_filter.rejected:
+        _logger.info('%s: %d rows with invalid VIN skipped', settings.app_name, sum(vin_filter.rejected.values()),
+                     extra={'data_source': source.data_source, 'rejected_rows': dict(vin_filter.rejected)})
 
-            print(json_dumps(payload))
+    return state['hashed_rows']
 
-            response = requests_post(
-                '{}/vindb/vin_records/create/'.format(settings.vindb_host),
-                data=json_dumps(payload),
-                headers={
-                    'Content-Type': 'application/json'
-                }, timeout=120
-            )
 
-            extra = {
-                'data_source': settings.webapp_data_source,
-                'hash_functions': settings.webapp_hash_functions,
-                'latest_hashed_id': latest_hashed,
-                'latest_id': latest_id,
-                'success': response.status_code == 201,
-            }
+def resubmit_dead_letters(source, stop_flag, batch_size=1000):
+    """
+    Submit the dead lettered records of source again. Acknowledged records leave the store, records VinDB refuses
+    again stay in it with the new reason. Returns the number of acknowledged and of refused records.
+    """
+    store = get_dead_letter_store()
+    # records failing again are stored with a later failed_at, so they are read only once
+    started_at = time.time()
+    acknowledged = refused = 0
 
-            if response.status_code != 201:  # error
-                extra['result'] = json_dumps({'status_code': response.status_code, 'response': response.text}),
-                _logger.error('%s:  %d rows processed unsuccessfully (ids %s-%s). Status code: %s. Error: "%s"',
-                              settings.app_name, len(records),
-                              records[0]['uuid'], records[-1]['uuid'], response.status_code, response.text, extra=extra)
-                raise Exception('Rows have not been stored in DB. Status code: {}. Error: "{}"'.format(
-                    response.status_code, response.text)
-                )
-
-            # success
-            hashed_records = response.json()['records']
-            # check if all records stored in DB
-            rs = len(hashed_records) == len(records)
-            extra.update(
-                {
-                    'success': rs,
-                    'hashed_rows': len(hashed_records),
-                    'hashed_rows_ids': [r['uuid'] for r in hashed_records],
-                    'tried_hash_rows_ids': [r['uuid'] for r in records] if not rs else None,
-                    'result': json_dumps({'status_code': response.status_code}),
-                }
-            )
-            if rs:
-                _logger.info('%s: %d rows processed successfully (ids %s-%s)', settings.app_name, len(hashed_records),
-                             hashed_records[0]['uuid'], hashed_records[-1]['uuid'], extra=extra)
-            else:
-                if len(hashed_records):
-                    _logger.info('%s: %d of %d rows processed successfully (ids %s-%s)', settings.app_name,
-                                 len(hashed_records), len(records), hashed_records[0]['uuid'],
-                                 hashed_records[-1]['uuid'],
-                                 extra=extra)
-
-            print('--- {} seconds ---'.format(time.time() - start_time))
-
-    return hashed_rows
+    while not stop_flag[0]:
+        records = store.get(source.data_source, batch_size, failed_before=started_at)
+
+        if not records:
+            break
+
+        delivery = get_delivery(
+            lambda records: submit_records(source, records, records[-1]['uuid']),
+            stop_flag
+        )
+        standards = {}
+
+        for record in records:
+            standards.setdefault(record['standard_version'], []).append(record)
+
+        # one submission per standard, like hash_range, a uuid is only unique within its standard
+        for standard_records in standards.values():
+            standard_acknowledged, standard_refused = delivery.deliver(source.data_source, standard_records)
+            store.remove(source.data_source, standard_records, failed_before=started_at)
+
+            acknowledged += standard_acknowledged
+            refused += standard_refused
+
+    return acknowledged, refused
+
+
+def hash_rows(stop_flag, reconcile=False, state=None):
+    return hash_source(get_source('vehicle'), stop_flag, reconcile, state)
+
+
+def hash_rows_app(stop_flag, reconcile=False, state=None):
+    return hash_source(get_source('webapp'), stop_flag, reconcile, state)
@@ -0,0 +1,324 @@
+import os
+import random
+import tempfile
+import time
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from requests import ConnectTimeout, ReadTimeout
+
+from vinchain_database_hasher.backfill import Backfill, clear_plan, get_plan, save_plan
+from vinchain_database_hasher.benchmark import NullSigner, generate_cars, generate_children, override_settings
+from vinchain_database_hasher.checkpoint import get_checkpoint_store
+from vinchain_database_hasher.delivery import DeadLetterStore, Delivery, SubmitError
+from vinchain_database_hasher.hashcache import HashCache
+from vinchain_database_hasher.hashing import hash_records_by_standard
+from vinchain_database_hasher.serialization import encode_payload
+from vinchain_database_hasher.signer import use_signer
+from vinchain_database_hasher.sources import get_source
+from vinchain_database_hasher.stub import StubVinDBServer
+from vinchain_database_hasher.submitter import AsyncSubmitter
+from vinchain_database_hasher.tasks import enrich_rows, submit_records
+from vinchain_db.models import TblCarsOptions, TblCarsEquipment, TblCarsConditionReports
+from vinchain_db.serializers import OptionsSchema
+
+
+def override_hasher_settings(test, **values):
+    """
+    Override hasher settings until the end of test.
+    """
+    settings_override = override_settings(**values)
+    settings_override.__enter__()
+    test.addCleanup(settings_override.__exit__, None, None, None)
+
+
+def make_records(uuids, standard_version=0):
+    return [
+        {'uuid': uuid, 'vin': '1HGCM82633A{:06d}'.format(uuid), 'standard_version': standard_version,
+         'hash': '{:064x}'.format(uuid)}
+        for uuid in uuids
+    ]
+
+
+class StubVinDBTestCase(SimpleTestCase):
+    """
+    Test case submitting unsigned records of the webapp source to a stub VinDB server.
+    """
+
+    def setUp(self):
+        self.stub = StubVinDBServer().start()
+        self.addCleanup(self.stub.stop)
+        use_signer(NullSigner())
+        self.addCleanup(use_signer, None)
+        override_hasher_settings(self, vindb_host=self.stub.url)
+        self.source = get_source('webapp')
+
+    def stub_uuids(self):
+        return [record['uuid'] for record in self.stub.records.get(self.source.data_source, [])]
+
+
+class CarTablesTestCase(TestCase):
+    """
+    Test case with 40 synthetic cars and 3 options, equipment and condition reports rows per car.
+    """
+
+    children = (TblCarsOptions, TblCarsEquipment, TblCarsConditionReports)
+
+    @classmethod
+    def setUpClass(cls):
+        # the vinchain_db models are unmanaged, so the test database has no tables for them
+        cls.model = get_source('vehicle').get_model()
+        existing = connection.introspection.table_names()
+        cls.created_models = [
+            model for model in (cls.model,) + cls.children if model._meta.db_table not in existing
+        ]
+
+        with connection.schema_editor() as editor:
+            for model in cls.created_models:
+                editor.create_model(model)
+
+        super(CarTablesTestCase, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(CarTablesTestCase, cls).tearDownClass()
+
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.created_models):
+                editor.delete_model(model)
+
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(0)
+        car_ids = generate_cars(cls.model, 40, rnd)
+
+        for child in cls.children:
+            generate_children(child, car_ids, 3, rnd)
+
+    def get_rows(self, count):
+        return list(self.model.objects.order_by('pk').values()[:count])
+
+
+class EnrichRowsTest(CarTablesTestCase):
+    def test_child_queries_do_not_depend_on_batch_size(self):
+        for count in (1, 10, 40):
+            rows = self.get_rows(count)
+
+            with self.assertNumQueries(3):
+                enrich_rows(rows)
+
+    def test_first_child_row_by_pk(self):
+        schema = OptionsSchema()
+
+        for row in enrich_rows(self.get_rows(40)):
+            first = TblCarsOptions.objects.filter(car_id=row['id']).order_by('pk').values().first()
+            self.assertEqual(row['options'], schema.dump(first).data['options'])
+
+
+class HashRecordsTest(CarTablesTestCase):
+    def setUp(self):
+        source = get_source('vehicle')
+        self.serializer = source.get_serializer()
+        self.standard_versions = source.get_standards()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def hash_payload(self, rows, workers, cache=None, after_ids=None):
+        records = hash_records_by_standard(
+            [dict(row) for row in rows], self.serializer, self.standard_versions, workers=workers, cache=cache,
+            after_ids=after_ids
+        )
+
+        return encode_payload([records[standard_version] for standard_version in self.standard_versions])
+
+    def test_process_pool_payload_matches_serial(self):
+        rows = self.get_rows(40)
+        after_ids = {self.standard_versions[-1]: rows[19]['id']}
+
+        for options in ({}, {'after_ids': after_ids}):
+            serial = self.hash_payload(rows, 0, **options)
+
+            for workers in (0, 2):
+                cache = HashCache(os.path.join(self.tmp_dir.name, 'cache-{}-{}.sqlite3'.format(workers, len(options))))
+
+                # a cold cache computes every hash, a warm one returns them all
+                self.assertEqual(self.hash_payload(rows, workers, cache, **options), serial)
+                self.assertEqual(self.hash_payload(rows, workers, cache, **options), serial)
+
+            self.assertEqual(self.hash_payload(rows, 2, **options), serial)
+
+
+class DeliveryTest(SimpleTestCase):
+    def setUp(self):
+        self.records = [{'uuid': uuid, 'standard_version': 0, 'hash': str(uuid)} for uuid in range(1, 9)]
+        self.calls = []
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def deliver(self, submit, dead_letters=None):
+        def recorded_submit(records):
+            self.calls.append([record['uuid'] for record in records])
+            return submit(records)
+
+        return Delivery(recorded_submit, [False], retries=2, backoff=0, dead_letters=dead_letters).deliver(
+            'cars', self.records
+        )
+
+    def dead_letter_store(self):
+        return DeadLetterStore(os.path.join(self.tmp_dir.name, 'dead_letters.sqlite3'))
+
+    def test_split_on_too_large_and_read_timeout(self):
+        for error in (SubmitError('too large', 413), ReadTimeout()):
+            self.calls = []
+
+            def submit(records):
+                if len(records) > 2:
+                    raise error
+
+                return records
+
+            self.assertEqual(self.deliver(submit), (8, 0))
+            self.assertEqual([len(call) for call in self.calls], [8, 4, 2, 2, 4, 2, 2])
+
+    def test_connect_timeout_does_not_split(self):
+        def submit(records):
+            raise ConnectTimeout()
+
+        with self.assertRaises(ConnectTimeout):
+            self.deliver(submit, self.dead_letter_store())
+
+        self.assertEqual([len(call) for call in self.calls], [8, 8, 8])
+
+    def test_only_unacknowledged_records_are_resubmitted(self):
+        def submit(records):
+            return records[::2]
+
+        self.assertEqual(self.deliver(submit), (8, 0))
+        self.assertEqual(self.calls, [[1, 2, 3, 4, 5, 6, 7, 8], [2, 4, 6, 8], [4, 8], [8]])
+
+    def test_refused_records_are_dead_lettered(self):
+        store = self.dead_letter_store()
+
+        def submit(records):
+            raise SubmitError('bad request', 400)
+
+        self.assertEqual(self.deliver(submit, store), (0, 8))
+        self.assertEqual(store.count('cars'), 8)
+
+    def test_refused_records_are_logged_without_a_store(self):
+        def submit(records):
+            return [record for record in records if record['uuid'] <= 4]
+
+        with self.assertLogs('vinchain_database_hasher.delivery', 'ERROR'):
+            self.assertEqual(self.deliver(submit), (4, 0))
+
+    def test_outages_are_raised_and_not_dead_lettered(self):
+        store = self.dead_letter_store()
+
+        def submit(records):
+            raise SubmitError('unavailable', 503)
+
+        with self.assertRaises(SubmitError):
+            self.deliver(submit, store)
+
+        self.assertEqual(store.count('cars'), 0)
+
+
+class BackfillCheckpointTest(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        override_hasher_settings(self, checkpoint_path=os.path.join(tmp_dir.name, 'checkpoints.sqlite3'))
+
+        self.source = get_source('vehicle').copy(data_source='cars', hash_functions=[0, 1])
+        self.store = get_checkpoint_store()
+
+    def test_checkpoints_before_the_range_are_not_moved(self):
+        # the first standard reached the start of the range, the second is behind it
+        self.store.set('cars', 100)
+        self.store.set('cars:standard:1', 50)
+
+        with self.assertLogs('vinchain_database_hasher.backfill', 'WARNING'):
+            Backfill(self.source, 100, 500, 4, 1).move_checkpoints()
+
+        self.assertEqual(self.store.get('cars'), 500)
+        self.assertEqual(self.store.get('cars:standard:1'), 50)
+
+    def test_missing_checkpoints_are_not_moved(self):
+        self.store.set('cars', 300)
+
+        with self.assertLogs('vinchain_database_hasher.backfill', 'WARNING'):
+            Backfill(self.source, 100, 500, 4, 1).move_checkpoints()
+
+        self.assertEqual(self.store.get('cars'), 500)
+        self.assertIsNone(self.store.get('cars:standard:1'))
+
+    def test_shards_are_pending_until_every_standard_finished(self):
+        backfill = Backfill(self.source, 100, 500, 4, 1)
+        self.store.set('cars:backfill:100-200', 200)
+        self.store.set('cars:backfill:100-200:standard:1', 200)
+        self.store.set('cars:backfill:200-300', 300)
+        self.store.set('cars:backfill:200-300:standard:1', 250)
+
+        self.assertEqual(backfill.pending_shards(), [(200, 300), (300, 400), (400, 500)])
+
+    def test_clear_plan_removes_the_progress_of_every_standard(self):
+        save_plan('cars', 100, 500, 4)
+        self.store.set('cars:backfill:100-200', 200)
+        self.store.set('cars:backfill:100-200:standard:1', 150)
+
+        clear_plan(self.source, 100, 500, 4)
+
+        self.assertIsNone(get_plan('cars'))
+        self.assertIsNone(self.store.get('cars:backfill:100-200'))
+        self.assertIsNone(self.store.get('cars:backfill:100-200:standard:1'))
+
+
+class AsyncSubmitterTest(StubVinDBTestCase):
+    def test_completes_only_the_prefix_before_a_failed_batch(self):
+        batches = [{'index': index, 'records': make_records(range(index * 10 + 1, index * 10 + 11))}
+                   for index in range(8)]
+        # the first batches are the slowest, so later ones are acknowledged first
+        delays = [0.3, 0.2, 0.1]
+        submitted = []
+        completed = []
+
+        def submit_batch(batch):
+            time.sleep(delays[batch['index']] if batch['index'] < len(delays) else 0)
+
+            if batch['index'] == 3:
+                raise SubmitError('Rows have not been stored in DB. Status code: 500', 500)
+
+            submit_records(self.source, batch['records'], batch['records'][-1]['uuid'])
+            submitted.append(batch['index'])
+
+        def complete_batch(batch):
+            completed.append(batch['index'])
+
+        with self.assertRaises(SubmitError):
+            AsyncSubmitter([False], concurrency=4).run(iter(batches), submit_batch, complete_batch)
+
+        self.assertEqual(submitted, [2, 1, 0])
+        self.assertEqual(completed, [0, 1, 2])
+        self.assertEqual(sorted(self.stub_uuids()), list(range(1, 31)))
+
+
+class StreamedSubmitTest(StubVinDBTestCase):
+    def test_streamed_bodies_round_trip(self):
+        records = make_records(range(1, 26))
+
+        for stream in ('json', 'ndjson'):
+            for gzip in (False, True):
+                self.stub.records.clear()
+                override_hasher_settings(self, vindb_stream=stream, vindb_stream_chunk_records=4, vindb_gzip=gzip)
+
+                submit_records(self.source, records, records[-1]['uuid'])
+
+                self.assertEqual(self.stub.records[self.source.data_source], records)
+
+    def test_streamed_bodies_time_out(self):
+        self.stub.latency = 1
+        override_hasher_settings(self, vindb_stream='ndjson', vindb_timeout=0.2)
+
+        with self.assertRaises(ReadTimeout):
+            submit_records(self.source, make_records(range(1, 6)), 5)
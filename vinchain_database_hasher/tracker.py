@@ -0,0 +1,63 @@
+import time
+
+from django.db.models import Max
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.vin import VinFilter
+
+
+def query_latest_id(source):
+    """
+    Highest id of source that a hashing cycle would fetch, 0 for an empty table.
+    Like the row walk it leaves out rows with invalid VINs when the source filters them in SQL.
+    Only MAX(pk) is selected, so wide rows are never read.
+    """
+    queryset = source.get_queryset()
+
+    if source.filter_vins and source.vin_filter_in_db:
+        queryset = VinFilter(source.vin_key).filter_queryset(queryset)
+
+    return queryset.aggregate(latest_id=Max(source.primary_key))['latest_id'] or 0
+
+
+class LatestIdTracker(object):
+    """
+    Latest id of a source, queried at most once per refresh_interval seconds.
+    """
+
+    def __init__(self, source, refresh_interval=10):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.latest_id = None
+        self.refreshed_at = 0
+
+    def refresh(self):
+        self.latest_id = query_latest_id(self.source)
+        self.refreshed_at = time.time()
+
+        return self.latest_id
+
+    def get(self):
+        if self.latest_id is None or time.time() - self.refreshed_at >= self.refresh_interval:
+            return self.refresh()
+
+        return self.latest_id
+
+    def has_new_rows(self, latest_hashed_id):
+        """
+        Probe for rows a hashing cycle would pick up, always with a fresh query.
+        """
+        return self.refresh() > latest_hashed_id
+
+
+_trackers = {}
+
+
+def get_latest_id_tracker(source):
+    key = (source.data_source, source.get_model())
+    tracker = _trackers.get(key)
+
+    if tracker is None:
+        tracker = _trackers[key] = LatestIdTracker(source, settings.latest_id_refresh_interval)
+
+    return tracker
@@ -0,0 +1,65 @@
+from collections import Counter
+import re
+
+
+VIN_MAX_LENGTH = 17
+VIN_PATTERN = re.compile(r'^[a-zA-Z0-9\-]+$')
+VIN_DB_PATTERN = r'^[a-zA-Z0-9\-]{1,%d}$' % VIN_MAX_LENGTH
+
+
+class VinFilter(object):
+    """
+    Accept rows whose VIN can be hashed and count rejected rows per reason.
+    """
+
+    MISSING = 'missing'
+    TOO_LONG = 'too_long'
+    INVALID_CHARACTERS = 'invalid_characters'
+
+    def __init__(self, vin_key='vin'):
+        self.vin_key = vin_key
+        self.rejected = Counter()
+
+    def reject_reason(self, row):
+        vin = row[self.vin_key]
+
+        if vin is None:
+            return self.MISSING
+
+        if len(vin) > VIN_MAX_LENGTH:
+            return self.TOO_LONG
+
+        if not VIN_PATTERN.match(vin):
+            return self.INVALID_CHARACTERS
+
+        return None
+
+    def partition(self, rows):
+        accepted = []
+        rejected = []
+
+        for row in rows:
+            reason = self.reject_reason(row)
+
+            if reason is None:
+                accepted.append(row)
+            else:
+                self.rejected[reason] += 1
+                rejected.append(row)
+
+        return accepted, rejected
+
+    def filter(self, rows):
+        for row in rows:
+            reason = self.reject_reason(row)
+
+            if reason is None:
+                yield row
+            else:
+                self.rejected[reason] += 1
+
+    def filter_queryset(self, queryset):
+        """
+        Apply the same rules in SQL, so rows with invalid VINs are never fetched.
+        """
+        return queryset.filter(**{'{}__regex'.format(self.vin_key): VIN_DB_PATTERN})
@@ -0,0 +1,125 @@
+import select
+import time
+
+from django.db import connection
+
+from vinchain_database_hasher.conf import settings
+from vinchain_database_hasher.delivery import stoppable_sleep
+from vinchain_database_hasher.tracker import get_latest_id_tracker
+
+NOTIFY_FUNCTION = 'vinchain_hasher_notify'
+
+
+def _throttle(woke_at, min_delay, stop_flag):
+    # back to back cycles start at least min_delay seconds apart, even when every probe sees new rows
+    stoppable_sleep(woke_at + min_delay - time.time(), stop_flag)
+
+    return time.time()
+
+
+class MaxIdWatcher(object):
+    """
+    Wait for new rows by probing the table, backing off exponentially while it stays idle.
+    """
+
+    def __init__(self, source, min_delay=1, max_delay=60, factor=2):
+        self.source = source
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.woke_at = 0
+
+    def wait(self, latest_hashed_id, stop_flag):
+        delay = self.min_delay
+
+        while not stop_flag[0]:
+            if get_latest_id_tracker(self.source).has_new_rows(latest_hashed_id):
+                self.woke_at = _throttle(self.woke_at, self.min_delay, stop_flag)
+                return not stop_flag[0]
+
+            stoppable_sleep(delay, stop_flag)
+            delay = min(delay * self.factor, self.max_delay)
+
+        return False
+
+
+class NotifyWaiter(object):
+    """
+    Wait for a PostgreSQL NOTIFY sent by the insert trigger of the source table.
+    The table is probed on every wakeup and at least every max_delay seconds, so lost notifications only delay a cycle.
+    """
+
+    def __init__(self, source, min_delay=1, max_delay=60, tick=1):
+        self.source = source
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.tick = tick
+        self.woke_at = 0
+
+    @property
+    def channel(self):
+        return notify_channel(self.source)
+
+    def wait(self, latest_hashed_id, stop_flag):
+        connection.ensure_connection()
+        pg_connection = connection.connection
+
+        with connection.cursor() as cursor:
+            cursor.execute('LISTEN {}'.format(connection.ops.quote_name(self.channel)))
+
+        deadline = time.time() + self.max_delay
+
+        while not stop_flag[0]:
+            del pg_connection.notifies[:]
+
+            if get_latest_id_tracker(self.source).has_new_rows(latest_hashed_id):
+                self.woke_at = _throttle(self.woke_at, self.min_delay, stop_flag)
+                return not stop_flag[0]
+
+            while not stop_flag[0] and not pg_connection.notifies and time.time() < deadline:
+                if select.select([pg_connection], [], [], self.tick)[0]:
+                    pg_connection.poll()
+
+            deadline = time.time() + self.max_delay
+
+        return False
+
+
+def notify_channel(source):
+    return 'vinchain_hasher_{}'.format(source.get_model()._meta.db_table)
+
+
+def install_notify_trigger(source):
+    """
+    Create a statement level insert trigger on the source table that notifies its channel.
+    """
+    quote_name = connection.ops.quote_name
+    table = source.get_model()._meta.db_table
+    trigger = quote_name('{}_notify'.format(notify_channel(source)))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE OR REPLACE FUNCTION {}() RETURNS trigger AS $$ '
+            'BEGIN PERFORM pg_notify(TG_ARGV[0], \'\'); RETURN NULL; END; '
+            '$$ LANGUAGE plpgsql'.format(NOTIFY_FUNCTION)
+        )
+        cursor.execute('DROP TRIGGER IF EXISTS {} ON {}'.format(trigger, quote_name(table)))
+        cursor.execute(
+            'CREATE TRIGGER {} AFTER INSERT ON {} FOR EACH STATEMENT EXECUTE PROCEDURE {}(\'{}\')'.format(
+                trigger, quote_name(table), NOTIFY_FUNCTION, notify_channel(source)
+            )
+        )
+
+
+def get_waiter(source, trigger):
+    """
+    Waiter for the trigger mode: 'interval' returns None, 'watch' a MaxIdWatcher,
+    'notify' a NotifyWaiter on PostgreSQL and a MaxIdWatcher elsewhere.
+    """
+    if trigger == 'interval':
+        return None
+
+    if trigger == 'notify' and connection.vendor == 'postgresql':
+        return NotifyWaiter(source, min_delay=settings.wakeup_min_delay, max_delay=settings.wakeup_max_delay)
+
+    return MaxIdWatcher(source, min_delay=settings.wakeup_min_delay, max_delay=settings.wakeup_max_delay)